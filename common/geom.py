@@ -0,0 +1,189 @@
+import os
+import mmap
+import struct
+from array import array
+from hashlib import sha256
+from math import pi
+from common.r3 import Transform
+from common.r3array import R3Array
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+class Geom:
+    """ Полиэдр в виде массивов вершин и граней """
+    # Параметры конструктора: координаты вершин (массив nv x 3),
+    # смещения граней в массиве индексов (nf + 1 чисел) и сам массив
+    # индексов вершин граней (нумерация вершин с нуля); пары индексов
+    # концов рёбер без дубликатов вычисляются, если не заданы
+
+    def __init__(self, vertexes, offsets, indexes, edges=None):
+        self.vertexes, self.offsets, self.indexes = vertexes, offsets, indexes
+        self.edges = uniq_edges(offsets, indexes) if edges is None else edges
+
+    # Координаты вершин в виде списка троек чисел
+    def points(self):
+        if hasattr(self.vertexes, "tolist"):
+            return self.vertexes.tolist()
+        return self.vertexes
+
+    # Список рёбер, каждое из которых задано парой индексов вершин
+    def edge_pairs(self):
+        if hasattr(self.edges, "tolist"):
+            return [tuple(e) for e in self.edges.tolist()]
+        return self.edges
+
+    # Список граней, каждая из которых задана списком индексов вершин
+    def facets(self):
+        offsets, indexes = list(self.offsets), list(self.indexes)
+        return [indexes[offsets[k]:offsets[k + 1]]
+                for k in range(len(offsets) - 1)]
+
+
+# Пары индексов концов рёбер граней без дубликатов в порядке первого
+# появления ребра при обходе граней (сторона (n - 1, n) грани идёт перед
+# стороной (n, n + 1), первой идёт сторона от последней вершины к
+# первой); концы пары упорядочены так же, как в первой грани с этим
+# ребром, — в этом порядке рёбра создаёт и построчная загрузка полиэдра
+def uniq_edges(offsets, indexes):
+    if np is not None and isinstance(indexes, np.ndarray):
+        prev = np.arange(len(indexes)) - 1
+        prev[offsets[:-1]] = offsets[1:] - 1
+        pairs = np.stack((indexes[prev], indexes), axis=1)
+        first = np.unique(np.sort(pairs, axis=1), axis=0,
+                          return_index=True)[1]
+        return pairs[np.sort(first)].reshape(-1, 2)
+    offsets, indexes = list(offsets), list(indexes)
+    seen, pairs = set(), []
+    for k in range(len(offsets) - 1):
+        facet = indexes[offsets[k]:offsets[k + 1]]
+        for n in range(len(facet)):
+            a, b = facet[n - 1], facet[n]
+            key = (a, b) if a < b else (b, a)
+            if key not in seen:
+                seen.add(key)
+                pairs.append((a, b))
+    return pairs
+
+
+# Загрузка полиэдра из файла целиком, а не построчно: блоки вершин и
+# граней разбираются за один проход, а поворот и гомотетия применяются
+# ко всем вершинам сразу как одно умножение на матрицу 3 x 3
+def load(file):
+    with open(file) as f:
+        return parse(f.read())
+
+
+# Разбор текста файла с описанием полиэдра
+def parse(text):
+    lines = text.splitlines()
+    # первая строка: коэффициент гомотетии и углы Эйлера
+    buf = lines[0].split()
+    c = float(buf.pop(0))
+    alpha, beta, gamma = (float(x) * pi / 180.0 for x in buf)
+    t = Transform.euler(alpha, beta, gamma, c)
+    # во второй строке число вершин, граней и рёбер полиэдра
+    nv, nf, ne = (int(x) for x in lines[1].split())
+    coords = " ".join(lines[2:nv + 2]).split()
+    tokens = " ".join(lines[nv + 2:]).split()
+    if np is not None:
+        coords = np.array(coords, dtype=float).reshape(nv, 3)
+        tokens = np.array(tokens, dtype=np.int64)
+        values = tokens.tolist()
+    else:
+        coords = [[float(x) for x in coords[k:k + 3]]
+                  for k in range(0, 3 * nv, 3)]
+        tokens = values = [int(x) for x in tokens]
+    vertexes = t.apply(R3Array.from_rows(coords)).rows()
+    # смещения количеств вершин граней в общем списке чисел
+    heads, pos = [], 0
+    while pos < len(values):
+        heads.append(pos)
+        pos += values[pos] + 1
+    offsets = [0]
+    for head in heads:
+        offsets.append(offsets[-1] + values[head])
+    if np is not None:
+        mask = np.ones(len(tokens), dtype=bool)
+        mask[heads] = False
+        return Geom(vertexes, np.array(offsets, dtype=np.int64),
+                    tokens[mask] - 1)
+    heads = set(heads)
+    indexes = [t - 1 for k, t in enumerate(tokens) if k not in heads]
+    return Geom(vertexes, offsets, indexes)
+
+
+# Заголовок файла кэша: сигнатура, хэш исходного файла, число вершин,
+# число граней, длина массива индексов вершин граней и число рёбер;
+# длина заголовка кратна восьми, чтобы массивы были выровнены; во второй
+# версии рёбра записаны в порядке первого появления (см. uniq_edges)
+MAGIC = b"GEOMC\0\0\2"
+HEADER = struct.Struct("=8s32s4q")
+
+
+# Загрузка полиэдра с использованием откомпилированного двоичного кэша
+# (файл с расширением .geomc рядом с исходным): массивы отображаются в
+# память без копирования, а при изменении исходного файла (его хэш не
+# совпадает с записанным в кэше) кэш строится заново
+def load_cached(file):
+    with open(file, "rb") as f:
+        data = f.read()
+    digest = sha256(data).digest()
+    geom = read_cache(file + "c", digest)
+    if geom is None:
+        geom = parse(data.decode())
+        write_cache(file + "c", digest, geom)
+    return geom
+
+
+# Чтение кэша; None, если кэш отсутствует, повреждён или устарел
+def read_cache(path, digest):
+    try:
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(buf) < HEADER.size:
+        return None
+    magic, cached, nv, nf, ni, ne = HEADER.unpack_from(buf)
+    if (magic != MAGIC or cached != digest or
+            len(buf) != HEADER.size + 8 * (3 * nv + nf + 1 + ni + 2 * ne)):
+        return None
+    pos, arrays = HEADER.size, []
+    for code, shape in (("d", (nv, 3)), ("q", (nf + 1,)),
+                        ("q", (ni,)), ("q", (ne, 2))):
+        size = 1
+        for n in shape:
+            size *= n
+        if np is not None:
+            arrays.append(np.frombuffer(
+                buf, dtype=code, count=size, offset=pos).reshape(shape))
+        else:
+            view = memoryview(buf)[pos:pos + 8 * size]
+            arrays.append(view.cast(code, shape) if size > 0 else [])
+        pos += 8 * size
+    vertexes, offsets, indexes, edges = arrays
+    return Geom(vertexes, offsets, indexes, edges)
+
+
+# Запись кэша: сначала во временный файл, который затем атомарно
+# переименовывается, чтобы параллельные процессы не увидели его частично
+def write_cache(path, digest, geom):
+    vertexes = [x for v in geom.points() for x in v]
+    edges = [n for e in geom.edge_pairs() for n in e]
+    offsets, indexes = list(geom.offsets), list(geom.indexes)
+    tmp = "%s.%d" % (path, os.getpid())
+    try:
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, digest, len(vertexes) // 3,
+                                len(offsets) - 1, len(indexes),
+                                len(edges) // 2))
+            for code, data in (("d", vertexes), ("q", offsets),
+                               ("q", indexes), ("q", edges)):
+                f.write(array(code, data).tobytes())
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
@@ -3,6 +3,8 @@ from math import sin, cos
 
 class R3:
     """ Вектор (точка) в R3 """
+    # Координаты хранятся в слотах, а не в словаре атрибутов экземпляра
+    __slots__ = ("x", "y", "z")
 
     # Конструктор
     def __init__(self, x, y, z):
@@ -20,6 +22,30 @@ class R3:
     def __mul__(self, k):
         return R3(k * self.x, k * self.y, k * self.z)
 
+    # Прибавление вектора other к данному «на месте»; отдельный метод, а
+    # не оператор +=, который для R3 по-прежнему создаёт новый вектор:
+    # вершины общие у граней и рёбер, и незаметное изменение вершины
+    # сдвинуло бы её во всех них
+    def add_to(self, other):
+        self.x += other.x
+        self.y += other.y
+        self.z += other.z
+        return self
+
+    # Вычитание вектора other из данного «на месте»
+    def sub_from(self, other):
+        self.x -= other.x
+        self.y -= other.y
+        self.z -= other.z
+        return self
+
+    # Умножение на число «на месте»
+    def mul_by(self, k):
+        self.x *= k
+        self.y *= k
+        self.z *= k
+        return self
+
     # Поворот вокруг оси Oz
     def rz(self, fi):
         return R3(
@@ -31,10 +57,28 @@ class R3:
         return R3(cos(fi) * self.x + sin(fi) * self.z,
                   self.y, -sin(fi) * self.x + cos(fi) * self.z)
 
+    # Применение линейного преобразования
+    def transform(self, t):
+        return R3(t.xx * self.x + t.xy * self.y + t.xz * self.z,
+                  t.yx * self.x + t.yy * self.y + t.yz * self.z,
+                  t.zx * self.x + t.zy * self.y + t.zz * self.z)
+
     # Скалярное произведение
     def dot(self, other):
         return self.x * other.x + self.y * other.y + self.z * other.z
 
+    # Скалярное произведение на разность векторов p и a; в отличие от
+    # self.dot(p - a) не создаёт промежуточного вектора
+    def dot_sub(self, p, a):
+        return (self.x * (p.x - a.x) + self.y * (p.y - a.y) +
+                self.z * (p.z - a.z))
+
+    # Точка self * (1 - t) + other * t отрезка, соединяющего self и other
+    def lerp(self, other, t):
+        s = 1.0 - t
+        return R3(s * self.x + t * other.x, s * self.y + t * other.y,
+                  s * self.z + t * other.z)
+
     # Векторное произведение
     def cross(self, other):
         return R3(
@@ -43,14 +87,61 @@ class R3:
             self.x * other.y - self.y * other.x)
 
 
+class Transform:
+    """ Поворот в R3, совмещённый с гомотетией """
+    # Параметры конструктора: матрица поворота (список строк) и
+    # коэффициент гомотетии; синусы и косинусы углов вычисляются один
+    # раз при построении матрицы, а не для каждой точки
+
+    def __init__(self, m=None, c=1.0):
+        self.m = m if m is not None else [
+            [1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+        self.c = c
+        # Элементы матрицы, умноженные на коэффициент гомотетии
+        (self.xx, self.xy, self.xz), (self.yx, self.yy, self.yz), \
+            (self.zx, self.zy, self.zz) = (
+                [c * a for a in row] for row in self.m)
+
+    # Поворот вокруг оси Oz
+    @staticmethod
+    def rz(fi):
+        return Transform([[cos(fi), -sin(fi), 0.0],
+                          [sin(fi), cos(fi), 0.0],
+                          [0.0, 0.0, 1.0]])
+
+    # Поворот вокруг оси Oy
+    @staticmethod
+    def ry(fi):
+        return Transform([[cos(fi), 0.0, sin(fi)],
+                          [0.0, 1.0, 0.0],
+                          [-sin(fi), 0.0, cos(fi)]])
+
+    # Поворот, заданный углами Эйлера, и гомотетия с коэффициентом c;
+    # результат совпадает с p.rz(alpha).ry(beta).rz(gamma) * c
+    @staticmethod
+    def euler(alpha, beta, gamma, c=1.0):
+        t = Transform.rz(gamma) @ Transform.ry(beta) @ Transform.rz(alpha)
+        return Transform(t.m, c)
+
+    # Композиция преобразований: сначала other, затем self
+    def __matmul__(self, other):
+        return Transform(
+            [[sum(self.m[i][k] * other.m[k][j] for k in range(3))
+              for j in range(3)] for i in range(3)], self.c * other.c)
+
+    # Применение к точке (R3) или к массиву точек (R3Array)
+    def apply(self, p):
+        return p.transform(self)
+
+
 if __name__ == "__main__":  # pragma: no cover
     x = R3(1.0, 1.0, 1.0)
-    print("x", type(x), x.__dict__)
+    print("x", type(x), (x.x, x.y, x.z))
     y = x + R3(1.0, -1.0, 0.0)
-    print("y", type(y), y.__dict__)
+    print("y", type(y), (y.x, y.y, y.z))
     y = y.rz(1.0)
-    print("y", type(y), y.__dict__)
+    print("y", type(y), (y.x, y.y, y.z))
     u = x.dot(y)
     print("u", type(u), u)
     v = x.cross(y)
-    print("v", type(v), v.__dict__)
+    print("v", type(v), (v.x, v.y, v.z))
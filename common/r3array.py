@@ -0,0 +1,134 @@
+from math import sin, cos
+from numbers import Integral
+from common.r3 import R3
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+# Поэлементное применение функции к столбцам координат и числам; столбцы
+# являются массивами NumPy, а при его отсутствии — обычными списками
+def _map(f, *args):
+    cols = [a for a in args if isinstance(a, list)]
+    if not cols:
+        return f(*args)
+    n = len(cols[0])
+    return [f(*t) for t in zip(
+        *(a if isinstance(a, list) else [a] * n for a in args))]
+
+
+# Столбец координат в виде списка чисел
+def _tolist(c):
+    return c.tolist() if hasattr(c, "tolist") else c
+
+
+class R3Array:
+    """ Массив векторов (точек) в R3, хранимый по столбцам координат """
+
+    # Конструктор: столбцы координат x, y, z одинаковой длины
+    def __init__(self, x, y, z):
+        if np is not None:
+            self.x, self.y, self.z = (
+                np.asarray(c, dtype=float) for c in (x, y, z))
+        else:
+            self.x, self.y, self.z = (
+                [float(t) for t in c] for c in (x, y, z))
+
+    # Массив из списка векторов
+    @staticmethod
+    def from_r3(vectors):
+        return R3Array([v.x for v in vectors], [v.y for v in vectors],
+                       [v.z for v in vectors])
+
+    # Массив из списка троек чисел (или массива NumPy размера n x 3)
+    @staticmethod
+    def from_rows(rows):
+        if np is not None:
+            rows = np.asarray(rows, dtype=float).reshape(-1, 3)
+            return R3Array(rows[:, 0], rows[:, 1], rows[:, 2])
+        rows = [tuple(r) for r in rows]
+        return R3Array([r[0] for r in rows], [r[1] for r in rows],
+                       [r[2] for r in rows])
+
+    # Число векторов
+    def __len__(self):
+        return len(self.x)
+
+    # Вектор с заданным индексом или массив, выбранный срезом либо
+    # набором индексов
+    def __getitem__(self, k):
+        if isinstance(k, Integral):
+            return R3(float(self.x[k]), float(self.y[k]), float(self.z[k]))
+        if isinstance(self.x, list) and not isinstance(k, slice):
+            return R3Array(*([c[n] for n in k]
+                             for c in (self.x, self.y, self.z)))
+        return R3Array(self.x[k], self.y[k], self.z[k])
+
+    # Координаты в виде массива NumPy размера n x 3 или списка троек
+    def rows(self):
+        if isinstance(self.x, list):
+            return list(zip(self.x, self.y, self.z))
+        return np.column_stack((self.x, self.y, self.z))
+
+    # Список векторов
+    def to_r3(self):
+        return [R3(x, y, z) for x, y, z in zip(
+            *(_tolist(c) for c in (self.x, self.y, self.z)))]
+
+    # Сумма с массивом векторов или с одним вектором
+    def __add__(self, other):
+        return R3Array(_map(lambda a, b: a + b, self.x, other.x),
+                       _map(lambda a, b: a + b, self.y, other.y),
+                       _map(lambda a, b: a + b, self.z, other.z))
+
+    # Разность с массивом векторов или с одним вектором
+    def __sub__(self, other):
+        return R3Array(_map(lambda a, b: a - b, self.x, other.x),
+                       _map(lambda a, b: a - b, self.y, other.y),
+                       _map(lambda a, b: a - b, self.z, other.z))
+
+    # Умножение на число
+    def __mul__(self, k):
+        return R3Array(_map(lambda a: k * a, self.x),
+                       _map(lambda a: k * a, self.y),
+                       _map(lambda a: k * a, self.z))
+
+    # Поворот вокруг оси Oz
+    def rz(self, fi):
+        c, s = cos(fi), sin(fi)
+        return R3Array(_map(lambda x, y: c * x - s * y, self.x, self.y),
+                       _map(lambda x, y: s * x + c * y, self.x, self.y),
+                       self.z)
+
+    # Поворот вокруг оси Oy
+    def ry(self, fi):
+        c, s = cos(fi), sin(fi)
+        return R3Array(_map(lambda x, z: c * x + s * z, self.x, self.z),
+                       self.y,
+                       _map(lambda x, z: -s * x + c * z, self.x, self.z))
+
+    # Применение линейного преобразования
+    def transform(self, t):
+        return R3Array(
+            _map(lambda x, y, z: t.xx * x + t.xy * y + t.xz * z,
+                 self.x, self.y, self.z),
+            _map(lambda x, y, z: t.yx * x + t.yy * y + t.yz * z,
+                 self.x, self.y, self.z),
+            _map(lambda x, y, z: t.zx * x + t.zy * y + t.zz * z,
+                 self.x, self.y, self.z))
+
+    # Скалярные произведения (столбец чисел)
+    def dot(self, other):
+        return _map(lambda x, y, z, u, v, w: x * u + y * v + z * w,
+                    self.x, self.y, self.z, other.x, other.y, other.z)
+
+    # Векторные произведения
+    def cross(self, other):
+        return R3Array(
+            _map(lambda y, z, v, w: y * w - z * v,
+                 self.y, self.z, other.y, other.z),
+            _map(lambda x, z, u, w: z * u - x * w,
+                 self.x, self.z, other.x, other.z),
+            _map(lambda x, y, u, v: x * v - y * u,
+                 self.x, self.y, other.x, other.y))
@@ -1,10 +1,18 @@
-from math import pi, sqrt, floor, ceil
+from math import pi, sqrt, floor, ceil, cos, sin
+from array import array
+from bisect import bisect_left
 from time import time
 from random import randrange
 from functools import reduce
 from operator import add
-from common.r3 import R3
+from itertools import product
+from collections import deque
+from common.r3 import R3, Transform
 from common.tk_drawer import TkDrawer
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
 
 
 class Segment:
@@ -44,6 +52,13 @@ class Edge:
         self.beg, self.fin = beg, fin
         # Список «просветов»
         self.gaps = [Segment(Edge.SBEG, Edge.SFIN)]
+        # Список граней, которым принадлежит ребро
+        self.facets = []
+        # Список накопленных теней (None — тени сразу вычитаются из
+        # «просветов») и число теней, при котором список будет сжат
+        self.shades, self.limit = None, 0
+        # номер ребра в массивах пар (ребро, грань)
+        self.number = -1
 
     # Учёт тени от одной грани
     def shadow(self, facet):
@@ -57,30 +72,112 @@ class Edge:
             return
 
         # Нахождение одномерной тени на ребре
-        shade = Segment(Edge.SBEG, Edge.SFIN)
-        for u, v in zip(facet.vertexes, facet.v_normals()):
-            shade.intersect(self.intersect_edge_with_normal(u, v))
-            if shade.is_degenerate():
-                return
-
-        shade.intersect(
-            self.intersect_edge_with_normal(
-                facet.vertexes[0], facet.h_normal()))
-        if shade.is_degenerate():
+        clipped = self.clip(facet)
+        if clipped is None:
+            return
+        shade = Segment(*clipped)
+        if self.shades is not None:
+            self.add_shade(shade)
             return
         # Преобразование списка «просветов», если тень невырождена
         gaps = [s.subtraction(shade) for s in self.gaps]
         self.gaps = [
             s for s in reduce(add, gaps, []) if not s.is_degenerate()]
 
+    # Одномерная тень грани на ребре в виде пары чисел (t0, t1) или
+    # None, если тень вырождена. Стандартный отрезок последовательно
+    # отсекается полупространствами грани (как в алгоритме Сайруса —
+    # Бека), причём промежуточные отрезки не создаются. «Вертикальные»
+    # полупространства задаются прямыми на плоскости проекции, поэтому
+    # для каждого из них достаточно двух умножений на конец ребра
+    def clip(self, facet):
+        x0, y0, z0 = self.beg.x, self.beg.y, self.beg.z
+        x1, y1, z1 = self.fin.x, self.fin.y, self.fin.z
+        t0, t1 = Edge.SBEG, Edge.SFIN
+        for a, b, u, v in facet.lines:
+            f0, f1 = a * (x0 - u) + b * (y0 - v), a * (x1 - u) + b * (y1 - v)
+            if f0 < 0.0:
+                if f1 >= 0.0:
+                    x = - f0 / (f1 - f0)
+                    if x < t1:
+                        t1 = x
+            elif f1 < 0.0:
+                x = - f0 / (f1 - f0)
+                if x > t0:
+                    t0 = x
+            else:
+                return None
+            if t0 >= t1:
+                return None
+        a, b, c, u, v, w = facet.plane
+        f0 = a * (x0 - u) + b * (y0 - v) + c * (z0 - w)
+        f1 = a * (x1 - u) + b * (y1 - v) + c * (z1 - w)
+        if f0 < 0.0:
+            if f1 >= 0.0:
+                x = - f0 / (f1 - f0)
+                if x < t1:
+                    t1 = x
+        elif f1 < 0.0:
+            x = - f0 / (f1 - f0)
+            if x > t0:
+                t0 = x
+        else:
+            return None
+        return (t0, t1) if t0 < t1 else None
+
+    # Переход к накоплению теней вместо их немедленного вычитания
+    def collect(self):
+        self.shades, self.limit = [], 2
+
+    # Добавление тени к накопленным; при достижении предельного числа
+    # теней их список сжимается до объединения, что позволяет заметить
+    # полностью затенённое ребро, не дожидаясь окончания перебора граней
+    def add_shade(self, shade):
+        self.shades.append(shade)
+        if len(self.shades) >= self.limit:
+            self.shades = Edge.union(self.shades)
+            self.limit = 2 * len(self.shades) + 2
+            shade = self.shades[0]
+        if shade.beg <= Edge.SBEG and shade.fin >= Edge.SFIN:
+            self.gaps = []
+
+    # Вычисление «просветов» по накопленным теням: дополнение их
+    # объединения до стандартного отрезка находится за один проход
+    def merge(self):
+        if self.shades is None:
+            return
+        if len(self.gaps) > 0:
+            gaps, t = [], Edge.SBEG
+            for s in Edge.union(self.shades):
+                if s.beg > t:
+                    gaps.append(Segment(t, s.beg))
+                t = s.fin
+            if t < Edge.SFIN:
+                gaps.append(Segment(t, Edge.SFIN))
+            self.gaps = gaps
+        self.shades = None
+
+    # Объединение отрезков: отрезки сортируются по началу, после чего
+    # перекрывающиеся соседние отрезки сливаются
+    @staticmethod
+    def union(segments):
+        result = []
+        for s in sorted(segments, key=lambda s: s.beg):
+            if result and s.beg <= result[-1].fin:
+                if s.fin > result[-1].fin:
+                    result[-1] = Segment(result[-1].beg, s.fin)
+            else:
+                result.append(s)
+        return result
+
     # Преобразование одномерных координат в трёхмерные
     def r3(self, t):
-        return self.beg * (Edge.SFIN - t) + self.fin * t
+        return self.beg.lerp(self.fin, t)
 
     # Пересечение ребра с полупространством, задаваемым точкой (a)
     # на плоскости и вектором внешней нормали (n) к ней
     def intersect_edge_with_normal(self, a, n):
-        f0, f1 = n.dot(self.beg - a), n.dot(self.fin - a)
+        f0, f1 = n.dot_sub(self.beg, a), n.dot_sub(self.fin, a)
         if f0 >= 0.0 and f1 >= 0.0:
             return Segment(Edge.SFIN, Edge.SBEG)
         if f0 < 0.0 and f1 < 0.0:
@@ -91,10 +188,16 @@ class Edge:
 
 class Facet:
     """ Грань полиэдра """
-    # Параметры конструктора: список вершин
+    # Параметры конструктора: список вершин и, возможно, список их
+    # индексов в массиве вершин полиэдра
 
-    def __init__(self, vertexes):
-        self.vertexes = vertexes
+    def __init__(self, vertexes, indexes=None):
+        self.vertexes, self.indexes = vertexes, indexes
+        # Грань, которая представляет данную среди заслоняющих граней
+        # (она сама или объединение её с соседними гранями той же плоскости)
+        self.occluder = self
+        # номер среди заслоняющих граней в массивах сетки гнёзд
+        self.number = -1
 
     # «Вертикальна» ли грань?
     def is_vertical(self):
@@ -116,37 +219,446 @@ class Facet:
 
     # Предкомпиляция грани
     def precompile(self):
-        self._center = sum(self.vertexes, R3(0.0, 0.0, 0.0)
-                           ) * (1.0 / len(self.vertexes))
+        self._center = R3(0.0, 0.0, 0.0)
+        for v in self.vertexes:
+            self._center += v
+        self._center *= 1.0 / len(self.vertexes)
         n = (
             self.vertexes[1] - self.vertexes[0]).cross(
             self.vertexes[2] - self.vertexes[0])
         self._h_normal = n * (-1.0) if n.dot(Polyedr.V) < 0.0 else n
         self._v_normals = [self._vert(x) for x in range(len(self.vertexes))]
         self._is_vertical = self.h_normal().dot(Polyedr.V) == 0.0
+        # Прямые a*(x - u) + b*(y - v) = 0 на плоскости проекции,
+        # ограничивающие «вертикальные» полупространства, в виде четвёрок
+        # (a, b, u, v) и плоскость грани в виде шестёрки (a, b, c, u, v, w).
+        # Левые части положительны вне полупространств; точка (u, v, w)
+        # является вершиной грани, поэтому для рёбер с общей вершиной
+        # разности координат вычисляются точно
+        self.lines = [(n.x, n.y, v.x, v.y)
+                      for v, n in zip(self.vertexes, self._v_normals)]
+        n, v = self._h_normal, self.vertexes[0]
+        self.plane = (n.x, n.y, n.z, v.x, v.y, v.z)
         self.zmax = max(v.z for v in self.vertexes)
         self.xmin = min(v.x for v in self.vertexes)
         self.ymin = min(v.y for v in self.vertexes)
         self.xmax = max(v.x for v in self.vertexes)
         self.ymax = max(v.y for v in self.vertexes)
+        # площадь проекции грани
+        self.area = 0.5 * abs(sum(
+            u.x * v.y - v.x * u.y
+            for u, v in zip(self.vertexes, self.vertexes[1:] +
+                            self.vertexes[:1])))
+
+    # Выпукла ли проекция грани: все её вершины лежат в замыканиях
+    # «вертикальных» полупространств (с точностью до ошибок округления)
+    def is_convex(self):
+        eps = 1e-9 * max(self.xmax - self.xmin, self.ymax - self.ymin)
+        for a, b, u, v in self.lines:
+            for p in self.vertexes:
+                if a * (p.x - u) + b * (p.y - v) > eps * sqrt(a * a + b * b):
+                    return False
+        return True
+
+    # Одномерные тени грани сразу на многих рёбрах (то же, что Edge.clip
+    # для каждого из них): параметры — массивы NumPy координат начал и
+    # концов рёбер; результат — массивы t0, t1 и маска невырожденных
+    # теней. Прямые грани записываются как плоскости с c = 0, так что все
+    # полупространства обрабатываются одной операцией над матрицей
+    # значений (полупространство x рёбро); значения совпадают с Edge.clip
+    def clip_many(self, x0, y0, z0, x1, y1, z1):
+        m = np.array([(a, b, 0.0, u, v, 0.0) for a, b, u, v in self.lines] +
+                     [self.plane]).T[:, :, None]
+        a, b, c, u, v, w = m
+        f0 = a * (x0 - u) + b * (y0 - v) + c * (z0 - w)
+        f1 = a * (x1 - u) + b * (y1 - v) + c * (z1 - w)
+        out, inside = f0 < 0.0, f1 < 0.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x = - f0 / (f1 - f0)
+        t0 = np.where(~out & inside, x, Edge.SBEG).max(axis=0)
+        t1 = np.where(out & ~inside, x, Edge.SFIN).min(axis=0)
+        return t0, t1, (out | inside).all(axis=0) & (t0 < t1)
 
     # Вспомогательный метод
     def _vert(self, k):
         n = (self.vertexes[k] - self.vertexes[k - 1]).cross(Polyedr.V)
-        return n * \
-            (-1.0) if n.dot(self.vertexes[k - 1] - self.center()) < 0.0 else n
+        return n * (-1.0) if n.dot_sub(
+            self.vertexes[k - 1], self.center()) < 0.0 else n
+
+
+class Grid:
+    """ Сетка гнёзд в виде массивов (формат CSR) """
+    # Параметры конструктора: гнёзда (словарь списков граней по парам
+    # индексов) и список граней, которые нумеруются с нуля. Номера граней
+    # всех гнёзд хранятся подряд в одном массиве, а начало списка каждого
+    # гнезда — в массиве смещений. Если непустые гнёзда занимают
+    # достаточную долю описанного вокруг них прямоугольника, номер гнезда
+    # вычисляется по его индексам, иначе хранится в хэше
+
+    # Наибольшее отношение числа гнёзд прямоугольника к числу непустых,
+    # при котором прямоугольник хранится целиком
+    DENSITY = 4
+
+    # Если списки граней гнёзд упорядочены по убыванию zmax (zsorted),
+    # то перебор граней гнезда прекращается на первой «низкой» для ребра
+    # грани; для этого рядом с номерами граней хранятся их zmax со знаком
+    # минус (чтобы массив в каждом гнезде возрастал)
+    def __init__(self, nests, facets, zsorted=False):
+        self.facets = facets
+        for n, f in enumerate(facets):
+            f.number = n
+        keys = sorted(k for k in nests if nests[k])
+        if keys:
+            self.i0 = min(k[0] for k in keys)
+            self.j0 = min(k[1] for k in keys)
+            self.nx = max(k[0] for k in keys) - self.i0 + 1
+            self.ny = max(k[1] for k in keys) - self.j0 + 1
+        else:
+            self.i0 = self.j0 = self.nx = self.ny = 0
+        self.dense = self.nx * self.ny <= Grid.DENSITY * len(keys)
+        if self.dense:
+            self.index = None
+            cells = [[] for c in range(self.nx * self.ny)]
+            for i, j in keys:
+                cells[(i - self.i0) * self.ny + j - self.j0] = nests[i, j]
+        else:
+            self.index = {k: c for c, k in enumerate(keys)}
+            cells = [nests[k] for k in keys]
+        self.offsets = array("l", [0])
+        self.ids = array("l")
+        self.heights = array("d") if zsorted else None
+        for c in cells:
+            self.ids.extend(f.number for f in c)
+            self.offsets.append(len(self.ids))
+            if zsorted:
+                self.heights.extend(-f.zmax for f in c)
+        # номер последнего ребра, для которого грань стала кандидатом
+        # (список, а не array: он часто читается и записывается, а
+        # элементы array при каждом обращении упаковываются в объекты)
+        self.stamps = [-1] * len(facets)
+        self.epoch = -1
+
+    # Число гнёзд в массиве смещений
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    # Грани из заданных гнёзд без повторов, кроме граней ребра e; вместо
+    # хэша учтённых граней каждому ребру назначается новый номер, который
+    # записывается в массив отметок граней
+    def candidates(self, e, cells):
+        self.epoch += 1
+        epoch, stamps, ids, offsets = \
+            self.epoch, self.stamps, self.ids, self.offsets
+        for f in e.facets:
+            if f.occluder.number >= 0:
+                stamps[f.occluder.number] = epoch
+        index, i0, j0, nx, ny = self.index, self.i0, self.j0, self.nx, self.ny
+        heights, z0 = self.heights, -min(e.beg.z, e.fin.z)
+        for i, j in cells:
+            if index is None:
+                i, j = i - i0, j - j0
+                if not (0 <= i < nx and 0 <= j < ny):
+                    continue
+                c = i * ny + j
+            else:
+                c = index.get((i, j), -1)
+                if c < 0:
+                    continue
+            lo, hi = offsets[c], offsets[c + 1]
+            if heights is not None:
+                if lo == hi or heights[lo] >= z0:
+                    continue
+                hi = bisect_left(heights, z0, lo, hi)
+            for n in ids[lo:hi]:
+                if stamps[n] != epoch:
+                    stamps[n] = epoch
+                    yield self.facets[n]
+
+
+class Node:
+    """ Узел квадродерева """
+    __slots__ = ("x", "y", "size", "facets", "children",
+                 "xmin", "ymin", "xmax", "ymax")
+
+    # Параметры конструктора: левый нижний угол квадрата узла и длина его
+    # стороны; грани узла могут выходить за квадрат не более чем на
+    # половину стороны, чем и определяется «свободный» прямоугольник узла
+    def __init__(self, x, y, size):
+        self.x, self.y, self.size = x, y, size
+        self.facets, self.children = [], None
+        self.xmin, self.ymin = x - 0.5 * size, y - 0.5 * size
+        self.xmax, self.ymax = x + 1.5 * size, y + 1.5 * size
+
+    # Помещается ли грань в «свободный» прямоугольник узла
+    def fits(self, f):
+        return (self.xmin <= f.xmin and f.xmax <= self.xmax and
+                self.ymin <= f.ymin and f.ymax <= self.ymax)
+
+    # Потомок, квадрат которого содержит центр прямоугольника грани
+    def child(self, f):
+        i = 2 * (f.xmin + f.xmax > 2.0 * self.x + self.size)
+        return self.children[i + (f.ymin + f.ymax > 2.0 * self.y + self.size)]
+
+    # Деление узла на четыре потомка
+    def split(self):
+        half = 0.5 * self.size
+        self.children = [Node(self.x + dx, self.y + dy, half)
+                         for dx in (0.0, half) for dy in (0.0, half)]
+
+
+class Quadtree:
+    """ «Свободное» (loose) квадродерево граней """
+    # Параметры конструктора: список граней, наибольшее число граней в
+    # листе (при его превышении лист делится) и наибольшая глубина.
+    # Каждая грань хранится один раз — в самом глубоком узле, в который
+    # она помещается, поэтому крупные грани остаются в узлах верхних
+    # уровней, а мелкие в густонаселённых областях уходят вглубь
+
+    CAPACITY = 8
+    DEPTH = 12
+
+    def __init__(self, facets, capacity=CAPACITY, depth=DEPTH):
+        self.capacity, self.depth = capacity, depth
+        if facets:
+            x, y = min(f.xmin for f in facets), min(f.ymin for f in facets)
+            size = max(max(f.xmax for f in facets) - x,
+                       max(f.ymax for f in facets) - y)
+        else:
+            x = y = size = 0.0
+        self.root = Node(x, y, size if size > 0.0 else 1.0)
+        for f in facets:
+            self.insert(self.root, 0, f)
+
+    # Добавление грани в поддерево узла заданной глубины
+    def insert(self, node, depth, f):
+        while node.children is not None:
+            child = node.child(f)
+            if not child.fits(f):
+                node.facets.append(f)
+                return
+            node, depth = child, depth + 1
+        node.facets.append(f)
+        if len(node.facets) > self.capacity and depth < self.depth:
+            facets = node.facets
+            node.facets = []
+            node.split()
+            for g in facets:
+                self.insert(node, depth, g)
+
+    # Узлы дерева с их глубинами
+    def nodes(self):
+        stack = [(self.root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            yield node, depth
+            if node.children is not None:
+                stack.extend((c, depth + 1) for c in node.children)
+
+    # Грани, прямоугольники которых пересекаются с прямоугольником
+    # ребра e, кроме граней самого ребра
+    def candidates(self, e):
+        own = [f.occluder for f in e.facets]
+        x0, x1 = min(e.beg.x, e.fin.x), max(e.beg.x, e.fin.x)
+        y0, y1 = min(e.beg.y, e.fin.y), max(e.beg.y, e.fin.y)
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if (node.xmin > x1 or node.xmax < x0 or
+                    node.ymin > y1 or node.ymax < y0):
+                continue
+            for f in node.facets:
+                if (f.xmin <= x1 and f.xmax >= x0 and f.ymin <= y1 and
+                        f.ymax >= y0 and f not in own):
+                    yield f
+            if node.children is not None:
+                stack.extend(node.children)
+
+
+class Volume:
+    """ Узел иерархии ограничивающих объёмов """
+    __slots__ = ("xmin", "ymin", "xmax", "ymax", "zmax", "children",
+                 "facets")
+
+    # Параметры конструктора: грани поддерева; объём узла — прямоугольник,
+    # описанный вокруг их проекций, и наибольшая координата z их вершин
+    def __init__(self, facets):
+        self.xmin = min(f.xmin for f in facets)
+        self.ymin = min(f.ymin for f in facets)
+        self.xmax = max(f.xmax for f in facets)
+        self.ymax = max(f.ymax for f in facets)
+        self.zmax = max(f.zmax for f in facets)
+        self.children, self.facets = None, facets
+
+
+class BVH:
+    """ Иерархия ограничивающих объёмов (BVH) граней """
+    # Параметры конструктора: список граней и наибольшее число граней в
+    # листе. Узел делится пополам по медиане центров прямоугольников
+    # граней вдоль более длинной стороны его прямоугольника. «Вертикальные»
+    # грани рёбра не затеняют и в иерархию не включаются
+
+    LEAF = 4
+
+    def __init__(self, facets, leaf=LEAF):
+        self.leaf = leaf
+        facets = [f for f in facets if not f.is_vertical()]
+        self.root = self.build(facets) if facets else None
+
+    # Построение поддерева для списка граней
+    def build(self, facets):
+        node = Volume(facets)
+        if len(facets) > self.leaf:
+            if node.xmax - node.xmin >= node.ymax - node.ymin:
+                facets.sort(key=lambda f: f.xmin + f.xmax)
+            else:
+                facets.sort(key=lambda f: f.ymin + f.ymax)
+            half = len(facets) // 2
+            node.children = (self.build(facets[:half]),
+                             self.build(facets[half:]))
+            node.facets = ()
+        return node
+
+    # Узлы иерархии с их глубинами
+    def nodes(self):
+        stack = [(self.root, 0)] if self.root is not None else []
+        while stack:
+            node, depth = stack.pop()
+            yield node, depth
+            if node.children is not None:
+                stack.extend((c, depth + 1) for c in node.children)
+
+    # Грани, прямоугольники которых пересекаются с прямоугольником ребра
+    # e и которые не являются «низкими» для него, кроме граней самого
+    # ребра; поддеревья, лежащие целиком ниже ребра, не просматриваются
+    def candidates(self, e):
+        own = [f.occluder for f in e.facets]
+        x0, x1 = min(e.beg.x, e.fin.x), max(e.beg.x, e.fin.x)
+        y0, y1 = min(e.beg.y, e.fin.y), max(e.beg.y, e.fin.y)
+        z0 = min(e.beg.z, e.fin.z)
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            if (node.zmax <= z0 or node.xmin > x1 or node.xmax < x0 or
+                    node.ymin > y1 or node.ymax < y0):
+                continue
+            if node.children is not None:
+                stack.extend(node.children)
+                continue
+            for f in node.facets:
+                if (f.zmax > z0 and f.xmin <= x1 and f.xmax >= x0 and
+                        f.ymin <= y1 and f.ymax >= y0 and f not in own):
+                    yield f
+
+
+class Sweep:
+    """ Пары (ребро, грань), найденные «заметанием» по оси Ox """
+    # Параметры конструктора: списки рёбер и граней, которые нумеруются
+    # с нуля. Концы x-проекций всех рёбер и граней сортируются один раз;
+    # при проходе по ним поддерживаются множества рёбер и граней, чьи
+    # x-проекции содержат текущую точку, и каждая пара с пересекающимися
+    # x-проекциями проверяется на пересечение y-проекций и на то, что
+    # грань не «низкая» для ребра. Грани самого ребра и «вертикальные»
+    # грани в пары не входят. Номера граней пар хранятся подряд в одном
+    # массиве, сгруппированными по рёбрам, а начало группы каждого
+    # ребра — в массиве смещений
+
+    def __init__(self, edges, facets):
+        self.facets = facets
+        for n, f in enumerate(facets):
+            f.number = n
+        for n, e in enumerate(edges):
+            e.number = n
+        events = []
+        for n, e in enumerate(edges):
+            x0, x1 = min(e.beg.x, e.fin.x), max(e.beg.x, e.fin.x)
+            events.append((x0, 0, 0, n))
+            events.append((x1, 1, 0, n))
+        for n, f in enumerate(facets):
+            if not f.is_vertical():
+                events.append((f.xmin, 0, 1, n))
+                events.append((f.xmax, 1, 1, n))
+        # при равных x начала обрабатываются раньше концов, так что
+        # касающиеся проекции считаются пересекающимися
+        events.sort()
+        ylo = [min(e.beg.y, e.fin.y) for e in edges]
+        yhi = [max(e.beg.y, e.fin.y) for e in edges]
+        zlo = [min(e.beg.z, e.fin.z) for e in edges]
+        own = [set(f.occluder.number for f in e.facets) for e in edges]
+        groups = [[] for e in edges]
+        active = ({}, {})
+        for x, end, kind, n in events:
+            if end:
+                del active[kind][n]
+            elif kind == 0:
+                y0, y1, z0 = ylo[n], yhi[n], zlo[n]
+                for f in active[1].values():
+                    if (f.ymin <= y1 and f.ymax >= y0 and f.zmax > z0 and
+                            f.number not in own[n]):
+                        groups[n].append(f.number)
+                active[0][n] = n
+            else:
+                f = facets[n]
+                for k in active[0]:
+                    if (f.ymin <= yhi[k] and f.ymax >= ylo[k] and
+                            f.zmax > zlo[k] and n not in own[k]):
+                        groups[k].append(n)
+                active[1][n] = f
+        self.offsets = array("l", [0])
+        self.ids = array("l")
+        for g in groups:
+            g.sort()
+            self.ids.extend(g)
+            self.offsets.append(len(self.ids))
+
+    # Число пар
+    def __len__(self):
+        return len(self.ids)
+
+    # Пары, сгруппированные по граням: массивы смещений и номеров рёбер
+    def by_facets(self):
+        offsets = array("l", [0]) * (len(self.facets) + 1)
+        for n in self.ids:
+            offsets[n + 1] += 1
+        for n in range(len(self.facets)):
+            offsets[n + 1] += offsets[n]
+        ids, pos = array("l", [0]) * len(self.ids), array("l", offsets)
+        for k in range(len(self.offsets) - 1):
+            for n in self.ids[self.offsets[k]:self.offsets[k + 1]]:
+                ids[pos[n]] = k
+                pos[n] += 1
+        return offsets, ids
+
+    # Грани, образующие пары с ребром e
+    def candidates(self, e):
+        facets = self.facets
+        return [facets[n] for n in
+                self.ids[self.offsets[e.number]:self.offsets[e.number + 1]]]
 
 
 class Polyedr:
     """ Полиэдр """
     # вектор проектирования
     V = R3(0.0, 0.0, 1.0)
+    # число граней-кандидатов ребра, начиная с которого вычисление теней
+    # операциями над массивами NumPy быстрее, чем по одной (измерено на
+    # рёбрах и гранях модели cow, см. run_benchmark.py)
+    VECTOR = 128
 
-    # Параметры конструктора: файл, задающий полиэдр
-    def __init__(self, file):
+    # Параметры конструктора: файл, задающий полиэдр, и, возможно,
+    # функция его загрузки в виде массивов (например, common.geom.load)
+    def __init__(self, file, loader=None):
 
         # списки вершин, рёбер и граней полиэдра
         self.vertexes, self.edges, self.facets = [], [], []
+        # рёбра по упорядоченным парам индексов их вершин
+        self.topology = {}
+        # число проверок граней и число сэкономленных проверок (см.
+        # smart_shadow), попадания и промахи кэша (см. coherent_shadow)
+        self.tests, self.saved, self.hits, self.misses = 0, 0, 0, 0
+
+        if loader is not None:
+            self.from_geom(loader(file))
+            return
 
         # список строк файла
         with open(file) as f:
@@ -158,73 +670,801 @@ class Polyedr:
                     c = float(buf.pop(0))
                     # углы Эйлера, определяющие вращение
                     alpha, beta, gamma = (float(x) * pi / 180.0 for x in buf)
+                    # вращение и гомотетия как одно преобразование
+                    t = Transform.euler(alpha, beta, gamma, c)
                 elif i == 1:
                     # во второй строке число вершин, граней и рёбер полиэдра
                     nv, nf, ne = (int(x) for x in line.split())
                 elif i < nv + 2:
                     # задание всех вершин полиэдра
                     x, y, z = (float(x) for x in line.split())
-                    self.vertexes.append(R3(x, y, z).rz(
-                        alpha).ry(beta).rz(gamma) * c)
+                    self.vertexes.append(R3(x, y, z).transform(t))
                 else:
                     # вспомогательный массив
                     buf = line.split()
                     # количество вершин очередной грани
-                    size = int(buf.pop(0))
-                    # массив вершин этой грани
-                    vertexes = list(self.vertexes[int(n) - 1] for n in buf)
-                    # задание рёбер грани
-                    for n in range(size):
-                        self.edges.append(Edge(vertexes[n - 1], vertexes[n]))
-                    # задание самой грани
-                    self.facets.append(Facet(vertexes))
-
-    # Удаление дубликатов рёбер
-    def edges_uniq(self):
-        edges = {}
+                    buf.pop(0)
+                    # задание грани и её рёбер
+                    self.add_facet([int(n) - 1 for n in buf])
+
+    # Построение полиэдра по его описанию в виде массивов: рёбра
+    # создаются сразу по готовому списку пар индексов их концов (в том же
+    # порядке, что и при построчной загрузке), а грани лишь добавляются в
+    # списки граней своих рёбер
+    def from_geom(self, geom):
+        vertexes = self.vertexes = [R3(x, y, z) for x, y, z in geom.points()]
+        topology = self.topology
+        for a, b in geom.edge_pairs():
+            e = Edge(vertexes[a], vertexes[b])
+            topology[(a, b) if a < b else (b, a)] = e
+            self.edges.append(e)
+        for indexes in geom.facets():
+            facet = Facet([vertexes[n] for n in indexes], indexes)
+            a = indexes[-1]
+            for b in indexes:
+                topology[(a, b) if a < b else (b, a)].facets.append(facet)
+                a = b
+            self.facets.append(facet)
+
+    # Задание грани по индексам её вершин вместе с её рёбрами; каждое
+    # ребро создаётся один раз — при первой содержащей его грани, а
+    # следующие грани лишь добавляются в его список граней
+    def add_facet(self, indexes):
+        # массив вершин грани
+        vertexes = list(self.vertexes[n] for n in indexes)
+        facet = Facet(vertexes, indexes)
+        for n in range(len(indexes)):
+            a, b = indexes[n - 1], indexes[n]
+            key = (a, b) if a < b else (b, a)
+            if key not in self.topology:
+                self.topology[key] = Edge(vertexes[n - 1], vertexes[n])
+                self.edges.append(self.topology[key])
+            self.topology[key].facets.append(facet)
+        self.facets.append(facet)
+
+    # Сварка вершин: вершины, находящиеся на расстоянии не более eps
+    # друг от друга, заменяются одной. Кандидаты на совпадение ищутся
+    # в соседних ячейках хэшируемой сетки с шагом eps, после чего
+    # индексы вершин граней переписываются, а грани и рёбра строятся
+    # заново (вырожденные грани отбрасываются)
+    def weld(self, eps):
+        cells, vertexes, index = {}, [], []
+        for v in self.vertexes:
+            i, j, k = floor(v.x / eps), floor(v.y / eps), floor(v.z / eps)
+            found = None
+            for key in product(range(i - 1, i + 2), range(j - 1, j + 2),
+                               range(k - 1, k + 2)):
+                for n in cells.get(key, ()):
+                    w = vertexes[n]
+                    if ((v.x - w.x)**2 + (v.y - w.y)**2 +
+                            (v.z - w.z)**2 <= eps * eps):
+                        found = n
+                        break
+                if found is not None:
+                    break
+            if found is None:
+                found = len(vertexes)
+                vertexes.append(v)
+                cells.setdefault((i, j, k), []).append(found)
+            index.append(found)
+        facets = [[index[n] for n in f.indexes] for f in self.facets]
+        self.vertexes, self.edges, self.facets = vertexes, [], []
+        self.topology = {}
+        for indexes in facets:
+            # совпавшие соседние вершины грани заменяются одной
+            indexes = [n for k, n in enumerate(indexes)
+                       if n != indexes[k - 1]]
+            if len(indexes) >= 3:
+                self.add_facet(indexes)
+
+    # Согласование ориентации граней замкнутого полиэдра: обход в ширину
+    # по смежным граням помечает как перевёрнутые те из них, что обходят
+    # общее ребро в том же направлении, что и соседняя грань, после чего
+    # пометки инвертируются, если объём полиэдра получился отрицательным.
+    # Порядок вершин граней не меняется, а направление внешней нормали
+    # запоминается в атрибуте outward грани (1.0 или -1.0).
+    # Возвращает False, если полиэдр не замкнут или неориентируем
+    def orient(self):
+        if any(len(e.facets) != 2 for e in self.edges):
+            return False
+        sides = {f: set(zip(f.indexes[-1:] + f.indexes[:-1], f.indexes))
+                 for f in self.facets}
+        flipped = {}
+        for start in self.facets:
+            if start in flipped:
+                continue
+            flipped[start], queue = False, deque([start])
+            while queue:
+                f = queue.popleft()
+                for a, b in sides[f]:
+                    key = (a, b) if a < b else (b, a)
+                    for g in self.topology[key].facets:
+                        if g is f:
+                            continue
+                        # g обходит ребро навстречу f, если ориентации
+                        # граней (с учётом переворотов) согласованы
+                        flip = ((b, a) not in sides[g]) != flipped[f]
+                        if g not in flipped:
+                            flipped[g] = flip
+                            queue.append(g)
+                        elif flipped[g] != flip:
+                            return False
+        volume = 0.0
+        for f in self.facets:
+            v = f.vertexes
+            part = sum(v[0].dot(v[k].cross(v[k + 1]))
+                       for k in range(1, len(v) - 1))
+            volume += -part if flipped[f] else part
+        for f in self.facets:
+            f.outward = -1.0 if flipped[f] != (volume < 0.0) else 1.0
+        return True
+
+    # Лицевая ли грань согласованно ориентированного замкнутого полиэдра,
+    # т.е. направлена ли её внешняя нормаль к наблюдателю (ориентированная
+    # площадь проекции грани с учётом направления обхода положительна)
+    @staticmethod
+    def is_front(f):
+        v = f.vertexes
+        return f.outward * sum(v[k - 1].x * v[k].y - v[k].x * v[k - 1].y
+                               for k in range(len(v))) > 0.0
+
+    # Отсечение нелицевых граней замкнутого полиэдра: такие грани не могут
+    # ничего заслонить, поскольку всё, что лежит за ними, лежит и за
+    # лицевыми гранями, а рёбра между двумя нелицевыми гранями невидимы
+    def cull_back_faces(self):
+        front = {f: Polyedr.is_front(f) for f in self.facets}
+        self.occluders = [f for f in self.facets if front[f]]
+        hidden = 0
         for e in self.edges:
-            if (e.beg, e.fin) not in edges and (e.fin, e.beg) not in edges:
-                edges[(e.beg, e.fin)] = e
-        self.edges = list(edges.values())
+            if not any(front[f] for f in e.facets):
+                e.gaps = []
+                hidden += 1
+        return hidden
+
+    # Удаление рёбер, не являющихся характерными: ребро между двумя
+    # гранями, угол между нормалями которых меньше angle (в градусах),
+    # не изображается, если только грани не лежат в проекции по одну
+    # сторону от ребра (тогда ребро принадлежит контуру полиэдра)
+    def feature_edges(self, angle):
+        limit = cos(angle * pi / 180.0)
+        edges = []
+        for e in self.edges:
+            if len(e.facets) == 2:
+                f, g = e.facets
+                m, n = f.h_normal(), g.h_normal()
+                side = [(e.fin.x - e.beg.x) * (h.center().y - e.beg.y) -
+                        (e.fin.y - e.beg.y) * (h.center().x - e.beg.x)
+                        for h in e.facets]
+                if (side[0] * side[1] < 0.0 and
+                        m.dot(n) >= limit * sqrt(m.dot(m) * n.dot(n))):
+                    continue
+            edges.append(e)
+        self.edges = edges
+
+    # Лежат ли грани f и g в одной плоскости: синус угла между нормалями
+    # и расстояния от вершин g до плоскости f (по отношению к размеру
+    # граней) не превосходят eps
+    @staticmethod
+    def coplanar(f, g, eps):
+        m, n = f.h_normal(), g.h_normal()
+        mm, nn = m.dot(m), n.dot(n)
+        c = m.cross(n)
+        if c.dot(c) > eps * eps * mm * nn:
+            return False
+        size = max(f.xmax - f.xmin, f.ymax - f.ymin, g.xmax - g.xmin,
+                   g.ymax - g.ymin)
+        return all(m.dot_sub(v, f.vertexes[0])**2 <= eps * eps * size *
+                   size * mm for v in g.vertexes)
+
+    # Многоугольник, получаемый склейкой многоугольников p и q (списков
+    # индексов вершин) по общей стороне (a, b), или None, если он не
+    # является выпуклым в проекции (проверка грани на затенение ребра
+    # предполагает выпуклость грани); вершины, лежащие на сторонах
+    # многоугольника, сохраняются, чтобы концы общих сторон оставшихся
+    # пар граней по-прежнему были соседними в многоугольниках
+    def glue(self, p, q, a, b):
+        # p обходится от b до a, а q — от a до b
+        if p[(p.index(a) + 1) % len(p)] != b:
+            p = p[::-1]
+        if q[(q.index(b) + 1) % len(q)] != a:
+            q = q[::-1]
+        k, n = p.index(b), q.index(a)
+        cycle = p[k:] + p[:k] + (q[n:] + q[:n])[1:-1]
+        if len(set(cycle)) != len(cycle):
+            return None
+        turns, scale = self.turns(cycle)
+        if not (all(t >= -1e-9 * scale for t in turns) or
+                all(t <= 1e-9 * scale for t in turns)):
+            return None
+        return cycle if len(self.corners(cycle)) >= 3 else None
+
+    # Повороты (векторные произведения соседних сторон в проекции) в
+    # вершинах многоугольника и наибольший из их модулей
+    def turns(self, cycle):
+        v = [self.vertexes[n] for n in cycle]
+        turns = [(v[k].x - v[k - 1].x) * (v[(k + 1) % len(v)].y - v[k].y) -
+                 (v[k].y - v[k - 1].y) * (v[(k + 1) % len(v)].x - v[k].x)
+                 for k in range(len(v))]
+        return turns, max(abs(t) for t in turns)
+
+    # Вершины многоугольника без тех, что лежат на его сторонах
+    def corners(self, cycle):
+        turns, scale = self.turns(cycle)
+        return [n for n, t in zip(cycle, turns) if abs(t) > 1e-9 * scale]
+
+    # Слияние смежных заслоняющих граней, лежащих в одной плоскости, в
+    # более крупные выпуклые многоугольники; исходные грани (они по-прежнему
+    # определяют рёбра) ссылаются на представляющую их новую грань.
+    # Каждая грань меньшей группы сравнивается с гранью, представляющей
+    # большую, так что плоскости всех граней группы близки к плоскости её
+    # представителя; кроме того, все грани группы должны лежать в
+    # плоскости получившегося многоугольника, иначе они не сливаются.
+    # Параметр: допустимый угол (в градусах) между плоскостями граней
+    def merge_facets(self, angle):
+        eps = sin(angle * pi / 180.0)
+        occluders = set(self.occluders)
+        # многоугольник (список индексов вершин) для каждой грани и
+        # грани, входящие в каждый многоугольник
+        polygon = {f: f for f in self.occluders}
+        cycles = {f: list(f.indexes) for f in self.occluders}
+        members = {f: [f] for f in self.occluders}
+        for (a, b), e in self.topology.items():
+            if len(e.facets) != 2 or not all(f in occluders
+                                             for f in e.facets):
+                continue
+            p, q = (polygon[f] for f in e.facets)
+            if p is q:
+                continue
+            if len(members[p]) < len(members[q]):
+                p, q = q, p
+            if not all(Polyedr.coplanar(p, g, eps) for g in members[q]):
+                continue
+            cycle = self.glue(cycles[p], cycles[q], a, b)
+            if cycle is None:
+                continue
+            cycles[p] = cycle
+            del cycles[q]
+            members[p] += members.pop(q)
+            for f in members[p]:
+                polygon[f] = p
+        self.occluders = []
+        for p, cycle in cycles.items():
+            if len(members[p]) == 1:
+                self.occluders.append(p)
+                continue
+            cycle = self.corners(cycle)
+            f = Facet([self.vertexes[n] for n in cycle], cycle)
+            f.precompile()
+            if not all(Polyedr.coplanar(f, g, eps) for g in members[p]):
+                self.occluders += members[p]
+                continue
+            for g in members[p]:
+                g.occluder = f
+            self.occluders.append(f)
 
     # Оптимизация
-    def optimize(self):
-        stage_time = time()
+    # Параметры: weld — расстояние, в пределах которого вершины
+    # считаются совпадающими (None — без сварки вершин); closed — режим
+    # замкнутого полиэдра с отсечением нелицевых граней; feature — угол
+    # (в градусах) между нормалями смежных граней, меньше которого
+    # ребро не считается характерным и не изображается (None — все рёбра);
+    # coplanar — угол (в градусах), при котором смежные грани считаются
+    # лежащими в одной плоскости и сливаются (None — без слияния); cull —
+    # удаление из гнёзд граней, целиком заслонённых другими гранями;
+    # dda — обход только тех гнёзд, которые пересекает проекция ребра,
+    # вместо всех гнёзд описанного вокруг неё прямоугольника; csr —
+    # хранение гнёзд в массивах номеров граней (см. класс Grid); index —
+    # структура для поиска граней, которые могут затенить ребро: "grid" —
+    # сетка гнёзд, "quadtree" — квадродерево (см. класс Quadtree),
+    # "bvh" — иерархия ограничивающих объёмов (см. класс BVH), "sweep" —
+    # пары (ребро, грань), найденные заметанием (см. класс Sweep); zsort —
+    # упорядочение граней в гнёздах по убыванию zmax, которое позволяет
+    # не просматривать «низкие» для ребра грани гнезда
+    def optimize(self, weld=None, closed=False, feature=None,
+                 coplanar=None, cull=False, dda=False, csr=False,
+                 index="grid", zsort=False):
+        self.dda, self.grid, self.tree, self.pairs = dda, None, None, None
+        self.heights = None
+        # дубликаты рёбер не создаются уже при загрузке полиэдра
         result = "   Удаление дубликатов рёбер\n" + \
-            "     Рёбер до    : %6d\n" % len(self.edges)
-        self.edges_uniq()
-        result += "     Рёбер после : %6d\n" % len(self.edges) + \
-            "     Время       : %6.2f сек.\n" % (time() - stage_time)
+            "     Рёбер       : %6d\n" % len(self.edges)
+        if weld is not None:
+            stage_time = time()
+            nv, ne = len(self.vertexes), len(self.edges)
+            self.weld(weld)
+            result += "   Сварка вершин\n" + \
+                "     Вершин до   : %6d\n" % nv + \
+                "     Вершин после: %6d\n" % len(self.vertexes) + \
+                "     Рёбер до    : %6d\n" % ne + \
+                "     Рёбер после : %6d\n" % len(self.edges) + \
+                "     Время       : %6.2f сек.\n" % (time() - stage_time)
+        # грани, которые размещаются по гнёздам и могут затенять рёбра
+        self.occluders = self.facets
+        if closed:
+            stage_time = time()
+            result += "   Отсечение нелицевых граней\n"
+            if self.orient():
+                hidden = self.cull_back_faces()
+                result += \
+                    "     Граней до   : %6d\n" % len(self.facets) + \
+                    "     Граней после: %6d\n" % len(self.occluders) + \
+                    "     Скрыто рёбер: %6d\n" % hidden
+            else:
+                result += "     Полиэдр не замкнут или неориентируем\n"
+            result += "     Время       : %6.2f сек.\n" % (time() - stage_time)
         stage_time = time()
         for f in self.facets:
             f.precompile()
         result += "   Предкомпиляция граней\n" + \
             "     Время       : %6.2f сек.\n" % (time() - stage_time)
+        if feature is not None:
+            stage_time = time()
+            ne = len(self.edges)
+            self.feature_edges(feature)
+            result += "   Удаление нехарактерных рёбер\n" + \
+                "     Рёбер до    : %6d\n" % ne + \
+                "     Рёбер после : %6d\n" % len(self.edges) + \
+                "     Время       : %6.2f сек.\n" % (time() - stage_time)
+        if coplanar is not None:
+            stage_time = time()
+            nf = len(self.occluders)
+            self.merge_facets(coplanar)
+            result += "   Слияние граней одной плоскости\n" + \
+                "     Граней до   : %6d\n" % nf + \
+                "     Граней после: %6d\n" % len(self.occluders) + \
+                "     Время       : %6.2f сек.\n" % (time() - stage_time)
+        # проверки рёбер на затенение смежными гранями не выполняются;
+        # учитываются только грани, которые остались среди заслоняющих
+        occluders = set(self.occluders)
+        result += "   Исключение смежных граней\n" + \
+            "     Проверок    : %6d\n" % sum(
+                len({f.occluder for f in e.facets} & occluders)
+                for e in self.edges)
         stage_time = time()
         self.facets_nests()
         result += "   Гнездование граней\n" + \
             "     Размер гнёзд: %6.2f\n" % self.step + \
-            "     Время       : %6.2f сек." % (time() - stage_time)
-        return result
+            "     Размещений  : %6d\n" % sum(
+                len(n) for n in self.nests.values()) + \
+            "     Время       : %6.2f сек.\n" % (time() - stage_time)
+        if cull:
+            stage_time = time()
+            nf = len(self.occluders)
+            self.cull_hidden_facets()
+            result += "   Удаление заслонённых граней\n" + \
+                "     Граней до   : %6d\n" % nf + \
+                "     Граней после: %6d\n" % len(self.occluders) + \
+                "     Время       : %6.2f сек.\n" % (time() - stage_time)
+        if zsort:
+            stage_time = time()
+            self.sort_nests()
+            result += "   Упорядочение гнёзд по высоте\n" + \
+                "     Время       : %6.2f сек.\n" % (time() - stage_time)
+        if csr:
+            stage_time = time()
+            self.grid = Grid(self.nests, self.occluders, zsort)
+            # списки граней гнёзд больше не нужны
+            self.nests = None
+            result += "   Упаковка гнёзд в массивы\n" + \
+                "     Гнёзд       : %6d\n" % len(self.grid) + \
+                "     Плотная     : %6s\n" % (
+                    "да" if self.grid.dense else "нет") + \
+                "     Время       : %6.2f сек.\n" % (time() - stage_time)
+        if index == "quadtree":
+            stage_time = time()
+            self.tree = Quadtree(self.occluders)
+            self.nests = None
+            nodes = list(self.tree.nodes())
+            result += "   Квадродерево\n" + \
+                "     Узлов       : %6d\n" % len(nodes) + \
+                "     Глубина     : %6d\n" % max(d for n, d in nodes) + \
+                "     Наиб. список: %5d\n" % max(
+                    len(n.facets) for n, d in nodes) + \
+                "     Время       : %6.2f сек.\n" % (time() - stage_time)
+        if index == "bvh":
+            stage_time = time()
+            self.tree = BVH(self.occluders)
+            self.nests = None
+            nodes = list(self.tree.nodes())
+            result += "   Иерархия ограничивающих объёмов\n" + \
+                "     Узлов       : %6d\n" % len(nodes) + \
+                "     Глубина     : %6d\n" % max(
+                    (d for n, d in nodes), default=0) + \
+                "     Время       : %6.2f сек.\n" % (time() - stage_time)
+        if index == "sweep":
+            stage_time = time()
+            self.pairs = Sweep(self.edges, self.occluders)
+            self.nests = None
+            result += "   Заметание\n" + \
+                "     Пар         : %6d\n" % len(self.pairs) + \
+                "     Время       : %6.2f сек.\n" % (time() - stage_time)
+        return result.rstrip("\n")
+
+    # Полностью ли заслоняет грань g грань f: все вершины f лежат строго
+    # внутри проекции (выпуклой) грани g и строго под её плоскостью.
+    # Тень грани f вычисляется по плоскости, проходящей через первые три
+    # её вершины, поэтому для неплоской грани под плоскостью g должны
+    # лежать и точки этой плоскости над остальными вершинами. Проекции
+    # обеих граней должны быть выпуклыми: иначе области, заданные их
+    # «вертикальными» полупространствами, не совпадают с проекциями.
+    # Кроме того, zmax грани f не должен превышать zmax грани g: ребро,
+    # которое Edge.shadow считает «низким» для g, должно быть «низким» и
+    # для f (плоскость неплоской грани g может подниматься выше её zmax)
+    @staticmethod
+    def covers(g, f):
+        if (g.is_vertical() or f.is_vertical() or f.zmax > g.zmax or
+                g.xmin >= f.xmin or g.xmax <= f.xmax or
+                g.ymin >= f.ymin or g.ymax <= f.ymax or
+                not g.is_convex() or not f.is_convex()):
+            return False
+        a, b, c, u, v, w = g.plane
+        a0, b0, c0, u0, v0, w0 = f.plane
+        for p in f.vertexes:
+            z = max(p.z, w0 - (a0 * (p.x - u0) + b0 * (p.y - v0)) / c0)
+            if a * (p.x - u) + b * (p.y - v) + c * (z - w) >= 0.0:
+                return False
+            for a1, b1, u1, v1 in g.lines:
+                if a1 * (p.x - u1) + b1 * (p.y - v1) >= 0.0:
+                    return False
+        return True
+
+    # Удаление из гнёзд граней, которые целиком заслонены другой гранью:
+    # всё, что они могли бы затенить, затеняет и заслоняющая грань.
+    # Заслоняющая грань покрывает проекцию заслонённой целиком и потому
+    # находится в каждом гнезде с ней, так что достаточно перебрать
+    # грани одного гнезда
+    def cull_hidden_facets(self):
+        hidden = set()
+        for f in self.occluders:
+            key = (floor(f.vertexes[0].x / self.step),
+                   floor(f.vertexes[0].y / self.step))
+            for g in self.nests.get(key, ()):
+                if g is not f and Polyedr.covers(g, f):
+                    hidden.add(f)
+                    break
+        self.occluders = [f for f in self.occluders if f not in hidden]
+        for key in self.nests:
+            self.nests[key] = [f for f in self.nests[key] if f not in hidden]
 
-    # «Умное» нахождение «просветов» на ребре
-    def smart_shadow(self, e):
+    # Упорядочение граней каждого гнезда по убыванию zmax; рядом
+    # хранятся массивы их zmax со знаком минус (возрастающие)
+    def sort_nests(self):
+        self.heights = {}
+        for key, facets in self.nests.items():
+            facets.sort(key=lambda f: -f.zmax)
+            self.heights[key] = array("d", (-f.zmax for f in facets))
+
+    # Грани из гнёзд, которые покрывает прямоугольник ребра (без повторов),
+    # или из дерева (квадродерева или BVH) либо списка пар, если они
+    # построены; грани, которым принадлежит само ребро, затенить его не
+    # могут и поэтому сразу считаются учтёнными
+    def candidates(self, e):
+        if self.pairs is not None:
+            return self.pairs.candidates(e)
+        if self.tree is not None:
+            return self.tree.candidates(e)
+        cells = self.dda_cells(e) if self.dda else self.rect_cells(e)
+        if self.grid is not None:
+            return self.grid.candidates(e, cells)
+        return self.nests_candidates(e, cells)
+
+    # Грани из гнёзд-списков (без повторов); если гнёзда упорядочены по
+    # высоте, то перебор граней гнезда прекращается на первой «низкой»
+    # грани, а гнёзда, в которых все грани «низкие», пропускаются
+    def nests_candidates(self, e, cells):
         # Хэш учтённых граней
-        processed = {}
-        for i in self.to_range(e.beg.x, e.fin.x):
-            for j in self.to_range(e.beg.y, e.fin.y):
-                for f in self.nests[(i, j)]:
-                    if f not in processed:
-                        processed[f] = True
-                        if len(e.gaps) > 0:
-                            e.shadow(f)
-                        else:
-                            return
-
-    # Нахождение «просветов»
-    def shadow(self):
+        processed = dict.fromkeys([f.occluder for f in e.facets], True)
+        heights, z0 = self.heights, -min(e.beg.z, e.fin.z)
+        for key in cells:
+            facets = self.nests.get(key)
+            if facets is None:
+                continue
+            if heights is not None:
+                h = heights[key]
+                if h[0] >= z0:
+                    continue
+                facets = facets[:bisect_left(h, z0)]
+            for f in facets:
+                if f not in processed:
+                    processed[f] = True
+                    yield f
+
+    # Гнёзда прямоугольника, описанного вокруг проекции ребра
+    # (с запасом в одно гнездо)
+    def rect_cells(self, e):
+        return product(self.to_range(e.beg.x, e.fin.x),
+                       self.to_range(e.beg.y, e.fin.y))
+
+    # Гнёзда, которые пересекает проекция ребра, в порядке их обхода
+    # вдоль ребра (алгоритм Amanatides–Woo). Грань размещается во всех
+    # гнёздах, пересекающих её прямоугольник, поэтому затеняющая часть
+    # ребра грань найдётся в одном из этих гнёзд. Если отрезок проходит
+    # вблизи угла гнезда (ошибки округления не позволяют понять, с какой
+    # стороны), посещаются оба соседних гнезда
+    def dda_cells(self, e, eps=1e-9):
+        step = self.step
+        x0, y0, x1, y1 = e.beg.x, e.beg.y, e.fin.x, e.fin.y
+        i, j = floor(x0 / step), floor(y0 / step)
+        i1, j1 = floor(x1 / step), floor(y1 / step)
+        di, dj = (1 if i1 > i else -1), (1 if j1 > j else -1)
+        # значения параметра t на отрезке [0, 1] при пересечении
+        # ближайших границ гнёзд и приращения t между границами
+        if i != i1:
+            tx = ((i + (di > 0)) * step - x0) / (x1 - x0)
+            dtx = step / abs(x1 - x0)
+        if j != j1:
+            ty = ((j + (dj > 0)) * step - y0) / (y1 - y0)
+            dty = step / abs(y1 - y0)
+        yield i, j
+        while i != i1 or j != j1:
+            if j == j1 or (i != i1 and tx < ty - eps):
+                i += di
+                tx += dtx
+            elif i == i1 or ty < tx - eps:
+                j += dj
+                ty += dty
+            else:
+                yield i + di, j
+                yield i, j + dj
+                i, j = i + di, j + dj
+                tx, ty = tx + dtx, ty + dty
+            yield i, j
+
+    # Оценка доли ребра e, лежащей в прямоугольнике грани f: меньшая из
+    # долей x- и y-проекции ребра, попадающих в проекции прямоугольника
+    @staticmethod
+    def overlap(e, f):
+        x0, x1 = min(e.beg.x, e.fin.x), max(e.beg.x, e.fin.x)
+        y0, y1 = min(e.beg.y, e.fin.y), max(e.beg.y, e.fin.y)
+        dx = min(x1, f.xmax) - max(x0, f.xmin)
+        dy = min(y1, f.ymax) - max(y0, f.ymin)
+        if dx < 0.0 or dy < 0.0:
+            return 0.0
+        return min(dx / (x1 - x0) if x1 > x0 else 1.0,
+                   dy / (y1 - y0) if y1 > y0 else 1.0)
+
+    # Порядки перебора граней-кандидатов ребра: ключи сортировки
+    ORDERS = {
+        # порядок гнёзд
+        "cell": lambda e, f: 0,
+        # сначала ближайшие к наблюдателю (с наибольшим zmax)
+        "zmax": lambda e, f: -f.zmax,
+        # сначала грани с наибольшей площадью проекции
+        "area": lambda e, f: -f.area,
+        # сначала грани, прямоугольник которых накрывает большую часть
+        # ребра (см. overlap)
+        "overlap": lambda e, f: -Polyedr.overlap(e, f),
+    }
+
+    # «Умное» нахождение «просветов» на ребре; если задан порог vector
+    # и NumPy доступен, то при числе кандидатов не меньше порога тени
+    # вычисляются сразу для всех кандидатов (см. vector_shadow); order —
+    # порядок перебора кандидатов (ключ словаря ORDERS, None — порядок
+    # гнёзд без сортировки). Считаются проверки граней (вызовы
+    # Edge.shadow) и, при заданном порядке, проверки, которые не
+    # понадобились, потому что ребро оказалось затенено целиком.
+    # Возвращается грань, после проверки которой ребро оказалось
+    # затенено целиком (None, если такой нет или она неизвестна)
+    def smart_shadow(self, e, vector=None, order=None):
+        # ребро, затенённое целиком ещё до перебора (например,
+        # нелицевое в режиме замкнутого полиэдра), не учитывается
+        if len(e.gaps) == 0:
+            return None
+        candidates = self.candidates(e)
+        if vector is not None and np is not None:
+            if self.pairs is not None:
+                # номера граней-кандидатов берутся прямо из массива пар
+                offsets = self.pairs.offsets
+                idx = self.pair_ids[offsets[e.number]:offsets[e.number + 1]]
+            else:
+                candidates = list(candidates)
+                idx = np.array([f.number for f in candidates],
+                               dtype=np.int64)
+            if len(idx) >= vector:
+                self.vector_shadow(e, idx)
+                return None
+        if order is not None:
+            key = Polyedr.ORDERS[order]
+            candidates = sorted(candidates, key=lambda f: key(e, f))
+            for n, f in enumerate(candidates):
+                self.tests += 1
+                e.shadow(f)
+                if len(e.gaps) == 0:
+                    self.saved += len(candidates) - n - 1
+                    return f
+            return None
+        for f in candidates:
+            self.tests += 1
+            e.shadow(f)
+            if len(e.gaps) == 0:
+                return f
+        return None
+
+    # Рёбра в порядке обхода в ширину графа, в котором смежны рёбра с
+    # общей вершиной: соседние рёбра обрабатываются подряд
+    def bfs_edges(self):
+        incident = {}
         for e in self.edges:
-            self.smart_shadow(e)
+            for v in (e.beg, e.fin):
+                incident.setdefault(v, []).append(e)
+        seen, result = set(), []
+        for start in self.edges:
+            if start in seen:
+                continue
+            seen.add(start)
+            head = len(result)
+            result.append(start)
+            while head < len(result):
+                e = result[head]
+                head += 1
+                for v in (e.beg, e.fin):
+                    for g in incident[v]:
+                        if g not in seen:
+                            seen.add(g)
+                            result.append(g)
+        return result
+
+    # Нахождение «просветов» на ребре с кэшем в вершинах: сначала
+    # проверяются грани, которые последними целиком затенили рёбра,
+    # проходящие через концы ребра e, и только если ребро осталось
+    # видимым хотя бы частично, перебираются все кандидаты. Тень
+    # невыпуклой грани, вычисленная по её полупространствам, может
+    # выходить за её пределы, поэтому такая грань из кэша проверяется,
+    # только если её прямоугольник пересекается с прямоугольником ребра
+    # (тогда она есть и среди кандидатов). Рёбра, затенённые целиком ещё
+    # до перебора, не учитываются ни в кэше, ни в счётчиках
+    def coherent_shadow(self, e, cache, vector=None, order=None):
+        if len(e.gaps) == 0:
+            return
+        own = [f.occluder for f in e.facets]
+        tried = []
+        for v in (e.beg, e.fin):
+            f = cache.get(v)
+            if f is None or f in own or f in tried:
+                continue
+            if Polyedr.overlap(e, f) == 0.0 and not f.is_convex():
+                continue
+            tried.append(f)
+            self.tests += 1
+            e.shadow(f)
+            if len(e.gaps) == 0:
+                self.hits += 1
+                break
+        else:
+            self.misses += 1
+            f = self.smart_shadow(e, vector, order)
+        if f is not None and len(e.gaps) == 0:
+            cache[e.beg] = cache[e.fin] = f
+
+    # Коэффициенты полупространств всех заслоняющих граней в одном
+    # массиве NumPy размера 6 x F x K (по коэффициентам a, b, c, u, v, w,
+    # чтобы выборка граней давала непрерывные массивы): прямые грани
+    # записаны как плоскости с c = 0, последней идёт плоскость грани, а
+    # недостающие до K полупространства заполнены её копиями (повторное
+    # отсечение тем же полупространством ничего не меняет); рядом — zmax
+    # граней и признаки их «вертикальности»
+    def halfspaces(self):
+        for n, f in enumerate(self.occluders):
+            f.number = n
+        k = max((len(f.lines) for f in self.occluders), default=0) + 1
+        rows = [[(a, b, 0.0, u, v, 0.0) for a, b, u, v in f.lines] +
+                [f.plane] * (k - len(f.lines)) for f in self.occluders]
+        self.planes = np.array(rows, dtype=float).reshape(-1, k, 6)
+        self.planes = np.ascontiguousarray(self.planes.transpose(2, 0, 1))
+        self.zmaxes = np.array([f.zmax for f in self.occluders], dtype=float)
+        self.verticals = np.array(
+            [f.is_vertical() for f in self.occluders], dtype=bool)
+        if self.pairs is not None:
+            self.pair_ids = np.array(self.pairs.ids, dtype=np.int64)
+
+    # Тени граней-кандидатов с номерами idx (массив NumPy) на ребре,
+    # вычисленные несколькими операциями над массивами (значения те же,
+    # что у Edge.clip: разности координат и их сумма с коэффициентами
+    # вычисляются в том же порядке); «низкие» и «вертикальные» грани
+    # отбрасываются маской, а невырожденные тени объединяются и
+    # вычитаются из «просветов» за один проход
+    def vector_shadow(self, e, idx):
+        if not e.gaps or len(idx) == 0:
+            return
+        idx = idx[(self.zmaxes[idx] > min(e.beg.z, e.fin.z)) &
+                  ~self.verticals[idx]]
+        p = self.planes[:, idx]
+        # значения левых частей неравенств на концах ребра (2 x n x K)
+        d = np.array(((e.beg.x, e.beg.y, e.beg.z),
+                      (e.fin.x, e.fin.y, e.fin.z)))[:, :, None, None] - p[3:]
+        d *= p[:3]
+        f0, f1 = d[:, 0] + d[:, 1] + d[:, 2]
+        out, inside = f0 < 0.0, f1 < 0.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x = - f0 / (f1 - f0)
+        t0 = np.where(inside > out, x, Edge.SBEG).max(axis=1)
+        t1 = np.where(out > inside, x, Edge.SFIN).min(axis=1)
+        mask = (out | inside).all(axis=1) & (t0 < t1)
+        merge = e.shades is None
+        if merge:
+            e.collect()
+        for t in zip(t0[mask].tolist(), t1[mask].tolist()):
+            e.add_shade(Segment(*t))
+        if merge:
+            e.merge()
+
+    # Нахождение «просветов»; при merge=True тени на каждом ребре
+    # накапливаются и объединяются сортировкой в конце, а не вычитаются
+    # из списка «просветов» по одной; при batch=True используется
+    # «пакетный» обход (см. batch_shadow); vector — наименьшее число
+    # граней-кандидатов ребра, при котором их тени вычисляются операциями
+    # над массивами NumPy (True — измеренный порог VECTOR, None — всегда
+    # по одной); order — порядок
+    # перебора граней-кандидатов (см. smart_shadow); при coherence=True
+    # рёбра обходятся в ширину и для каждого сначала проверяются грани из
+    # кэша в вершинах (см. coherent_shadow)
+    def shadow(self, merge=False, batch=False, vector=None, order=None,
+               coherence=False):
+        # число проверок граней и число сэкономленных проверок
+        self.tests, self.saved = 0, 0
+        # число рёбер, целиком затенённых гранью из кэша, и остальных
+        self.hits, self.misses = 0, 0
+        if batch:
+            return self.batch_shadow()
+        if vector is True:
+            vector = Polyedr.VECTOR
+        if vector is not None and np is not None:
+            self.halfspaces()
+        cache = {}
+        for e in self.bfs_edges() if coherence else self.edges:
+            if merge:
+                e.collect()
+            if coherence:
+                self.coherent_shadow(e, cache, vector, order)
+            else:
+                self.smart_shadow(e, vector, order)
+            e.merge()
+        return self
+
+    # Обход по граням, а не по рёбрам: для каждой грани находятся все
+    # рёбра, прямоугольники которых пересекаются с её прямоугольником
+    # (пары из Sweep), и тени грани на них вычисляются сразу для всех
+    # этих рёбер операциями над массивами координат их концов. Тени
+    # накапливаются на рёбрах и объединяются в конце; полностью
+    # затенённые рёбра из дальнейших пакетов исключаются
+    def batch_shadow(self):
+        pairs = self.pairs
+        if pairs is None:
+            pairs = Sweep(self.edges, self.occluders)
+        offsets, ids = pairs.by_facets()
+        for e in self.edges:
+            e.collect()
+        if np is not None:
+            ids = np.array(ids, dtype=np.int64)
+            # координаты концов рёбер по строкам: x0, y0, z0, x1, y1, z1
+            coords = np.array([(e.beg.x, e.beg.y, e.beg.z,
+                                e.fin.x, e.fin.y, e.fin.z)
+                               for e in self.edges], dtype=float)
+            coords = coords.reshape(-1, 6).T.copy()
+            # рёбра, уже затенённые целиком (например, в режиме
+            # замкнутого полиэдра), в пакеты не попадают
+            alive = np.array([bool(e.gaps) for e in self.edges],
+                             dtype=bool)
+        for n, f in enumerate(pairs.facets):
+            if offsets[n] == offsets[n + 1]:
+                continue
+            if np is None:
+                for k in ids[offsets[n]:offsets[n + 1]]:
+                    e = self.edges[k]
+                    if e.gaps:
+                        e.shadow(f)
+                continue
+            batch = ids[offsets[n]:offsets[n + 1]]
+            batch = batch[alive[batch]]
+            t0, t1, mask = f.clip_many(*coords[:, batch])
+            for k, a, b in zip(batch[mask].tolist(), t0[mask].tolist(),
+                               t1[mask].tolist()):
+                e = self.edges[k]
+                e.add_shade(Segment(a, b))
+                if not e.gaps:
+                    alive[k] = False
+        for e in self.edges:
+            e.merge()
         return self
 
     # Метод изображения полиэдра
@@ -242,7 +1482,7 @@ class Polyedr:
         edges = [self.edges[randrange(len(self.edges))] for i in range(COUNT)]
         self.step = sum((sqrt((e.fin.x - e.beg.x)**2 + (e.fin.y - e.beg.y)**2)
                          for e in edges)) / (2 * COUNT)
-        for f in self.facets:
+        for f in self.occluders:
             for i in self.to_range(f.xmin, f.xmax):
                 for j in self.to_range(f.ymin, f.ymax):
                     key = (i, j)
@@ -0,0 +1,376 @@
+#!/usr/bin/env -S python3 -B
+
+from contextlib import nullcontext
+from random import Random
+from glob import glob
+from sys import getsizeof
+from time import perf_counter
+from unittest.mock import patch
+import numpy as np
+from optimize_7.polyedr import (Polyedr, Edge, Segment, Grid, Quadtree,
+                                BVH, Sweep)
+
+
+# Тень грани на ребре, вычисляемая через пересечение объектов Segment
+# (так, как это делалось до появления Edge.clip)
+def segment_shade(e, f):
+    shade = Segment(Edge.SBEG, Edge.SFIN)
+    for u, v in zip(f.vertexes, f.v_normals()):
+        shade.intersect(e.intersect_edge_with_normal(u, v))
+        if shade.is_degenerate():
+            return None
+    shade.intersect(e.intersect_edge_with_normal(f.vertexes[0], f.h_normal()))
+    return None if shade.is_degenerate() else shade
+
+
+# Пары (ребро, грань), для которых вычисляется тень при удалении
+# невидимых линий: гнёзда общие, грань не «низкая» и не вертикальная
+def candidate_pairs(poly):
+    pairs = []
+    for e in poly.edges:
+        for f in poly.candidates(e):
+            if not ((e.beg.z >= f.zmax and e.fin.z >= f.zmax) or
+                    f.is_vertical()):
+                pairs.append((e, f))
+    return pairs
+
+
+# Время одного вызова функции в микросекундах (лучшее из нескольких)
+def per_call(func, pairs, repeat=3):
+    if not pairs:
+        return 0.0
+    best = None
+    for k in range(repeat):
+        start = perf_counter()
+        for e, f in pairs:
+            func(e, f)
+        delta = perf_counter() - start
+        best = delta if best is None or delta < best else best
+    return 1e6 * best / len(pairs)
+
+
+def bench_clip(poly):
+    pairs = candidate_pairs(poly)
+    print("   Тень грани на ребре\n" +
+          "     Пар         : %6d\n" % len(pairs) +
+          "     Segment     : %6.2f мкс\n" % per_call(segment_shade, pairs) +
+          "     Edge.clip   : %6.2f мкс" % per_call(Edge.clip, pairs))
+
+
+# Обход гнёзд для всех рёбер: число посещённых гнёзд, число граней-
+# кандидатов и время перебора кандидатов (лучшее из нескольких)
+def traverse(poly, repeat=3):
+    cells = sum(1 for e in poly.edges for key in (
+        poly.dda_cells(e) if poly.dda else poly.rect_cells(e)))
+    found = sum(1 for e in poly.edges for f in poly.candidates(e))
+    best = None
+    for k in range(repeat):
+        start = perf_counter()
+        for e in poly.edges:
+            for f in poly.candidates(e):
+                pass
+        delta = perf_counter() - start
+        best = delta if best is None or delta < best else best
+    return cells, found, best
+
+
+def bench_dda(poly):
+    result = "   Обход гнёзд\n"
+    for dda, title in ((False, "Прямоугольник"), (True, "DDA")):
+        poly.dda = dda
+        cells, found, best = traverse(poly)
+        result += "     %s\n" % title + \
+            "       Гнёзд     : %8d\n" % cells + \
+            "       Кандидатов: %8d\n" % found + \
+            "       Время     : %8.3f сек.\n" % best
+    print(result.rstrip("\n"))
+
+
+# Память (в килобайтах), занимаемая гнёздами-списками и массивами сетки
+# (без самих граней и целых чисел, общих для всех ключей)
+def nests_size(nests):
+    return (getsizeof(nests) + sum(
+        getsizeof(k) + getsizeof(v) for k, v in nests.items())) / 1024
+
+
+def grid_size(grid):
+    size = getsizeof(grid.offsets) + getsizeof(grid.ids) + \
+        getsizeof(grid.stamps)
+    if grid.index is not None:
+        size += getsizeof(grid.index) + sum(getsizeof(k) for k in grid.index)
+    return size / 1024
+
+
+def bench_csr(poly):
+    result = "   Гнёзда в массивах\n" + \
+        "     Списки      : %8.1f Кб\n" % nests_size(poly.nests)
+    grid = Grid(poly.nests, poly.occluders)
+    result += "     Массивы     : %8.1f Кб (%s)\n" % (
+        grid_size(grid), "плотная" if grid.dense else "разреженная")
+    for dda in (False, True):
+        poly.dda = dda
+        for title, g in (("Списки", None), ("Массивы", grid)):
+            poly.grid = g
+            cells, found, best = traverse(poly)
+            result += "     %-12s: %8.3f сек.\n" % (
+                title + (" DDA" if dda else ""), best)
+    poly.grid = None
+    print(result.rstrip("\n"))
+
+
+# Статистика списков кандидатов: среднее и наибольшее число граней на
+# ребро и время перебора кандидатов для всех рёбер
+def candidate_stats(poly, repeat=3):
+    counts = [sum(1 for f in poly.candidates(e)) for e in poly.edges]
+    best = None
+    for k in range(repeat):
+        start = perf_counter()
+        for e in poly.edges:
+            for f in poly.candidates(e):
+                pass
+        delta = perf_counter() - start
+        best = delta if best is None or delta < best else best
+    return sum(counts) / len(counts), max(counts), best
+
+
+def bench_quadtree(poly):
+    start = perf_counter()
+    tree = Quadtree(poly.occluders)
+    build = perf_counter() - start
+    nodes = list(tree.nodes())
+    result = "   Квадродерево\n" + \
+        "     Узлов       : %8d\n" % len(nodes) + \
+        "     Глубина     : %8d\n" % max(d for n, d in nodes) + \
+        "     Построение  : %8.3f сек.\n" % build + \
+        "     Кандидатов на ребро (среднее, наибольшее, время)\n"
+    for title, dda, t in (("Сетка", False, None), ("Сетка DDA", True, None),
+                          ("Дерево", False, tree)):
+        poly.dda, poly.tree = dda, t
+        mean, most, best = candidate_stats(poly)
+        result += "     %-12s: %8.1f %6d %8.3f сек.\n" % (
+            title, mean, most, best)
+    poly.dda, poly.tree = False, None
+    print(result.rstrip("\n"))
+
+
+# Гнёзда, упорядоченные по высоте: число кандидатов, число гнёзд, в
+# которых все грани «низкие» для ребра, и время перебора кандидатов
+def bench_zsort(poly):
+    result = "   Упорядочение гнёзд по высоте\n" + \
+        "     (кандидатов, пропущено гнёзд, время перебора)\n"
+    poly.sort_nests()
+    heights = poly.heights
+    for dda in (False, True):
+        poly.dda = dda
+        skipped = 0
+        for e in poly.edges:
+            z0 = -min(e.beg.z, e.fin.z)
+            for key in (poly.dda_cells(e) if dda else poly.rect_cells(e)):
+                skipped += key in heights and heights[key][0] >= z0
+        for title, h in (("Без порядка", None), ("По высоте", heights)):
+            poly.heights = h
+            mean, most, best = candidate_stats(poly)
+            result += "     %-16s: %8d %8d %8.3f сек.\n" % (
+                title + (" DDA" if dda else ""), round(mean * len(poly.edges)),
+                skipped if h else 0, best)
+    poly.dda, poly.heights = False, None
+    print(result.rstrip("\n"))
+
+
+# Широкая фаза целиком: построение сетки гнёзд и перебор кандидатов для
+# всех рёбер (с отбрасыванием «низких» граней) против заметания,
+# сразу дающего все пары (лучшее время из нескольких)
+def bench_sweep(poly, repeat=3):
+    result = "   Заметание\n" + \
+        "     (пар, построение, перебор, всего)\n"
+    for title in ("Сетка", "Заметание"):
+        build = scan = None
+        for k in range(repeat):
+            start = perf_counter()
+            if title == "Сетка":
+                poly.pairs = None
+                poly.facets_nests()
+            else:
+                poly.pairs = Sweep(poly.edges, poly.occluders)
+            middle = perf_counter()
+            found = 0
+            for e in poly.edges:
+                z = min(e.beg.z, e.fin.z)
+                for f in poly.candidates(e):
+                    found += f.zmax > z and not f.is_vertical()
+            finish = perf_counter()
+            if build is None or finish - start < build + scan:
+                build, scan = middle - start, finish - middle
+        result += "     %-12s: %8d %8.3f %8.3f %8.3f сек.\n" % (
+            title, found, build, scan, build + scan)
+    poly.pairs = None
+    print(result.rstrip("\n"))
+
+
+# Удаление невидимых линий обходом по рёбрам и по граням (с NumPy и
+# без него) на одних и тех же парах из Sweep; лучшее время из нескольких
+def bench_batch(name, repeat=3):
+    result = "   Обход по граням\n"
+    for title, batch, numpy in (("По рёбрам", False, True),
+                                ("По граням", True, True),
+                                ("Без NumPy", True, False)):
+        best = None
+        for k in range(repeat):
+            poly = Polyedr(f"data/{name}.geom")
+            poly.optimize(index="sweep")
+            with nullcontext() if numpy else \
+                    patch("optimize_7.polyedr.np", None):
+                start = perf_counter()
+                poly.shadow(batch=batch)
+                delta = perf_counter() - start
+            best = delta if best is None or delta < best else best
+        result += "     %-12s: %8.3f сек.\n" % (title, best)
+    facets = sum(1 for f in poly.occluders if not f.is_vertical())
+    result += "     Рёбер в пакете: %6.1f" % (len(poly.pairs) / max(facets, 1))
+    print(result)
+
+
+# Тени граней-кандидатов на ребре по одной и сразу для всех операциями
+# над массивами: время на ребро для случайных рёбер и случайных наборов
+# граней заданного размера (для выбора порога Polyedr.VECTOR) и время
+# удаления невидимых линий при разных порогах
+def bench_vector(name, sizes=(16, 64, 128, 256, 1024), count=40):
+    poly = Polyedr(f"data/{name}.geom")
+    poly.optimize(index="sweep")
+    poly.halfspaces()
+    result = "   Тени всех кандидатов сразу\n" + \
+        "     (кандидатов, по одной, сразу)\n"
+    rnd = Random(1)
+    for n in sizes:
+        if n > len(poly.occluders):
+            break
+        cases = [(rnd.choice(poly.edges), rnd.sample(poly.occluders, n))
+                 for k in range(count)]
+        times = []
+        for vector in (False, True):
+            start = perf_counter()
+            for e, facets in cases:
+                e.gaps = [Segment(Edge.SBEG, Edge.SFIN)]
+                if vector:
+                    poly.vector_shadow(e, np.array([f.number for f in facets]))
+                    continue
+                for f in facets:
+                    if e.gaps:
+                        e.shadow(f)
+            times.append(1e6 * (perf_counter() - start) / count)
+        result += "     %12d: %8.1f %8.1f мкс\n" % (n, *times)
+    for vector in (None, True, 0):
+        best = None
+        for k in range(3):
+            poly = Polyedr(f"data/{name}.geom")
+            poly.optimize(index="sweep")
+            start = perf_counter()
+            poly.shadow(vector=vector)
+            delta = perf_counter() - start
+            best = delta if best is None or delta < best else best
+        result += "     Порог %-6s: %8.3f сек.\n" % (
+            Polyedr.VECTOR if vector is True else vector, best)
+    print(result.rstrip("\n"))
+
+
+# Иерархия ограничивающих объёмов против сетки гнёзд: построение,
+# число кандидатов (для сетки — также без «низких» граней, которые
+# отбрасывает Edge.shadow) и время удаления невидимых линий
+def bench_bvh(name, repeat=3):
+    result = "   Иерархия ограничивающих объёмов\n" + \
+        "     (построение, кандидатов, из них не «низких», удаление " + \
+        "невидимых линий)\n"
+    for index in ("grid", "bvh"):
+        build = shadow = None
+        for k in range(repeat):
+            poly = Polyedr(f"data/{name}.geom")
+            poly.optimize()
+            start = perf_counter()
+            if index == "bvh":
+                poly.tree = BVH(poly.occluders)
+            else:
+                poly.facets_nests()
+            delta = perf_counter() - start
+            build = delta if build is None or delta < build else build
+            start = perf_counter()
+            poly.shadow()
+            delta = perf_counter() - start
+            shadow = delta if shadow is None or delta < shadow else shadow
+        found = high = 0
+        for e in poly.edges:
+            for f in poly.candidates(e):
+                found += 1
+                high += e.beg.z < f.zmax or e.fin.z < f.zmax
+        result += "     %-12s: %8.3f сек. %8d %8d %8.3f сек.\n" % (
+            "Сетка" if index == "grid" else "BVH", build, found, high, shadow)
+    print(result.rstrip("\n"))
+
+
+# Полиэдр после оптимизации с постоянным шагом сетки гнёзд (шаг
+# оценивается по случайной выборке рёбер, поэтому выборка фиксирована),
+# чтобы счётчики разных вариантов удаления невидимых линий были сравнимы
+def seeded(name, **kwargs):
+    with patch("optimize_7.polyedr.randrange", new=Random(1).randrange):
+        poly = Polyedr(f"data/{name}.geom")
+        poly.optimize(**kwargs)
+    return poly
+
+
+# Порядок перебора граней-кандидатов: число проверок граней, число
+# проверок, сэкономленных досрочным выходом (ребро затенено целиком), и
+# время удаления невидимых линий для сетки гнёзд и для заметания
+def bench_order(name, orders=(None, "cell", "zmax", "area", "overlap")):
+    result = "   Порядок перебора кандидатов\n" + \
+        "     (проверок, сэкономлено, время)\n"
+    for index in ("grid", "sweep"):
+        for order in orders:
+            best = None
+            for k in range(3):
+                poly = seeded(name, index=index)
+                start = perf_counter()
+                poly.shadow(order=order)
+                delta = perf_counter() - start
+                best = delta if best is None or delta < best else best
+            result += "     %-5s %-7s: %8d %8d %8.3f сек.\n" % (
+                index, order, poly.tests, poly.saved, best)
+    print(result.rstrip("\n"))
+
+
+# Кэш в вершинах (грань, последней целиком затенившая ребро через эту
+# вершину, проверяется первой) с обходом рёбер в ширину: число проверок
+# граней, попаданий и промахов кэша и время удаления невидимых линий
+def bench_coherence(name):
+    result = "   Кэш граней в вершинах\n" + \
+        "     (проверок, попаданий, промахов, время)\n"
+    for index in ("grid", "sweep"):
+        for coherence in (False, True):
+            best = None
+            for k in range(3):
+                poly = seeded(name, index=index)
+                start = perf_counter()
+                poly.shadow(coherence=coherence)
+                delta = perf_counter() - start
+                best = delta if best is None or delta < best else best
+            result += "     %-5s %-5s: %8d %8d %8d %8.3f сек.\n" % (
+                index, coherence, poly.tests, poly.hits, poly.misses, best)
+    print(result.rstrip("\n"))
+
+
+if __name__ == "__main__":
+    for file in sorted(glob("data/*.geom")):
+        name = file[len("data/"):-len(".geom")]
+        print("=======================================================")
+        print(f"Полиэдр '{name}'")
+        poly = Polyedr(f"data/{name}.geom")
+        poly.optimize()
+        bench_clip(poly)
+        bench_dda(poly)
+        bench_quadtree(poly)
+        bench_zsort(poly)
+        bench_csr(poly)
+        bench_sweep(poly)
+        bench_bvh(name)
+        bench_batch(name)
+        bench_vector(name)
+        bench_order(name)
+        bench_coherence(name)
@@ -0,0 +1,131 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import patch, mock_open
+from math import pi
+
+from common.r3 import R3
+from common.geom import load, load_cached
+from tests.matchers import R3ApproxMatcher
+
+FAKE_FILE_CONTENT = """200.0	45.0	45.0	30.0
+8	4	16
+-0.5	-0.5	0.5
+-0.5	0.5	0.5
+0.5	0.5	0.5
+0.5	-0.5	0.5
+-0.5	-0.5	-0.5
+-0.5	0.5	-0.5
+0.5	0.5	-0.5
+0.5	-0.5	-0.5
+4	5    6    2    1
+4	3    2    6    7
+4	3    7    8    4
+3	1    4    8"""
+
+
+class TestGeom(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        fake_file_path = 'data/holey_box.geom'
+        with patch('common.geom.open',
+                   new=mock_open(read_data=FAKE_FILE_CONTENT)) as _file:
+            self.geom = load(fake_file_path)
+            _file.assert_called_once_with(fake_file_path)
+
+    def test_num_vertexes(self):
+        self.assertEqual(len(self.geom.points()), 8)
+
+    def test_num_facets(self):
+        self.assertEqual(len(self.geom.facets()), 4)
+
+    # Рёбра не повторяются и идут в порядке первого появления в гранях
+    def test_edges(self):
+        self.assertEqual(len(self.geom.edge_pairs()), 12)
+        self.assertEqual(self.geom.edge_pairs()[:4],
+                         [(0, 4), (4, 5), (5, 1), (1, 0)])
+        self.assertIn((7, 3), self.geom.edge_pairs())
+
+    # Без NumPy рёбра те же
+    def test_edges_without_numpy(self):
+        with patch('common.geom.np', None), \
+                patch('common.r3array.np', None), \
+                patch('common.geom.open',
+                      new=mock_open(read_data=FAKE_FILE_CONTENT)):
+            geom = load('data/holey_box.geom')
+        self.assertEqual(geom.edge_pairs(), self.geom.edge_pairs())
+
+    # Индексы вершин граней нумеруются с нуля
+    def test_facets(self):
+        self.assertEqual(self.geom.facets()[0], [4, 5, 1, 0])
+        self.assertEqual(self.geom.facets()[3], [0, 3, 7])
+
+    # Поворот и гомотетия совпадают с построчной загрузкой
+    def test_vertexes(self):
+        alpha, beta, gamma = (x * pi / 180.0 for x in (45.0, 45.0, 30.0))
+        expected = R3(-0.5, 0.5, -0.5).rz(alpha).ry(beta).rz(gamma) * 200.0
+        self.assertEqual(R3ApproxMatcher(expected),
+                         R3(*self.geom.points()[5]))
+
+    # Загрузка без NumPy даёт тот же результат
+    def test_without_numpy(self):
+        with patch('common.geom.np', None), \
+                patch('common.r3array.np', None), \
+                patch('common.geom.open',
+                      new=mock_open(read_data=FAKE_FILE_CONTENT)):
+            geom = load('data/holey_box.geom')
+        self.assertEqual(geom.facets(), self.geom.facets())
+        for p, q in zip(geom.points(), self.geom.points()):
+            self.assertEqual(R3ApproxMatcher(R3(*p)), R3(*q))
+
+
+class TestGeomCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = TemporaryDirectory()
+        self.file = os.path.join(self.dir.name, "holey_box.geom")
+        with open(self.file, "w") as f:
+            f.write(FAKE_FILE_CONTENT)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def assertSameGeom(self, a, b):
+        self.assertEqual(a.facets(), b.facets())
+        self.assertEqual(a.edge_pairs(), b.edge_pairs())
+        for p, q in zip(a.points(), b.points()):
+            self.assertEqual(R3ApproxMatcher(R3(*p)), R3(*q))
+
+    # Кэш создаётся при первой загрузке и используется при следующей
+    def test_cache01(self):
+        geom = load_cached(self.file)
+        self.assertTrue(os.path.exists(self.file + "c"))
+        with patch('common.geom.parse') as parse:
+            cached = load_cached(self.file)
+            parse.assert_not_called()
+        self.assertSameGeom(geom, cached)
+
+    # При изменении исходного файла кэш строится заново
+    def test_cache02(self):
+        load_cached(self.file)
+        with open(self.file, "w") as f:
+            f.write(FAKE_FILE_CONTENT.replace("3\t1    4    8",
+                                              "4\t1    4    8    5"))
+        geom = load_cached(self.file)
+        self.assertEqual(geom.facets()[3], [0, 3, 7, 4])
+        self.assertSameGeom(geom, load(self.file))
+
+    # Повреждённый кэш игнорируется
+    def test_cache03(self):
+        load_cached(self.file)
+        with open(self.file + "c", "r+b") as f:
+            f.truncate(100)
+        self.assertSameGeom(load_cached(self.file), load(self.file))
+
+    # Кэш читается и без NumPy
+    def test_without_numpy(self):
+        geom = load_cached(self.file)
+        with patch('common.geom.np', None), \
+                patch('common.r3array.np', None):
+            self.assertSameGeom(load_cached(self.file), geom)
@@ -0,0 +1,1032 @@
+import unittest
+from math import sin, pi
+from random import Random
+from unittest.mock import patch, mock_open
+
+from common.r3 import R3
+import common.geom
+import optimize_7.polyedr
+from optimize_7.polyedr import (Polyedr, Edge, Facet, Segment, Grid,
+                                Quadtree, BVH, Sweep)
+
+FAKE_FILE_CONTENT = """200.0	45.0	45.0	30.0
+8	4	16
+-0.5	-0.5	0.5
+-0.5	0.5	0.5
+0.5	0.5	0.5
+0.5	-0.5	0.5
+-0.5	-0.5	-0.5
+-0.5	0.5	-0.5
+0.5	0.5	-0.5
+0.5	-0.5	-0.5
+4	5    6    2    1
+4	3    2    6    7
+4	3    7    8    4
+4	1    4    8    5"""
+
+
+def fake_polyedr(content=FAKE_FILE_CONTENT, **kwargs):
+    with patch('optimize_7.polyedr.open',
+               new=mock_open(read_data=content)):
+        return Polyedr('data/holey_box.geom', **kwargs)
+
+
+# Полиэдр из файла каталога data после оптимизации и удаления невидимых
+# линий; шаг сетки зависит от случайного выбора рёбер, поэтому он
+# фиксируется для воспроизводимости
+def shadowed_polyedr(name, optimize={}, shadow={}):
+    with patch('optimize_7.polyedr.randrange', new=Random(1).randrange):
+        p = Polyedr('data/%s.geom' % name)
+        p.optimize(**optimize)
+    return p.shadow(**shadow)
+
+
+# Видимая длина каждого из рёбер (в долях стандартного отрезка)
+def visible(polyedr):
+    return {tuple(round(t, 6) for t in (e.beg.x, e.beg.y, e.fin.x, e.fin.y)):
+            sum(s.fin - s.beg for s in e.gaps) for e in polyedr.edges}
+
+
+class TestTopology(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.polyedr = fake_polyedr()
+
+    # Каждое ребро «дырявого куба» создаётся ровно один раз
+    def test_num_edges(self):
+        self.assertEqual(len(self.polyedr.edges), 12)
+
+    # Все рёбра боковой поверхности разделяют ровно две грани
+    def test_edge_facets(self):
+        counts = sorted(len(e.facets) for e in self.polyedr.edges)
+        self.assertEqual(counts, [1] * 8 + [2] * 4)
+
+    # Ребро принадлежит каждой из своих граней
+    def test_edge_in_facets(self):
+        for e in self.polyedr.edges:
+            for f in e.facets:
+                self.assertIn(e.beg, f.vertexes)
+                self.assertIn(e.fin, f.vertexes)
+
+    # Рёбра доступны по упорядоченной паре индексов вершин
+    def test_topology(self):
+        e = self.polyedr.topology[(0, 4)]
+        self.assertIs(e.beg, self.polyedr.vertexes[0])
+        self.assertIs(e.fin, self.polyedr.vertexes[4])
+
+
+class TestAdjacent(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.polyedr = fake_polyedr()
+        self.result = self.polyedr.optimize()
+
+    # Грани, которым принадлежит ребро, не проверяются на его затенение
+    def test_candidates(self):
+        for e in self.polyedr.edges:
+            candidates = list(self.polyedr.candidates(e))
+            for f in e.facets:
+                self.assertNotIn(f, candidates)
+
+    # Число пропущенных проверок выводится в результатах оптимизации
+    def test_optimize(self):
+        self.assertIn("Проверок    :     16", self.result)
+
+
+class TestClosed(unittest.TestCase):
+
+    # Замкнутый куб; у второй грани порядок обхода вершин перевёрнут
+    CONTENT = FAKE_FILE_CONTENT.replace(
+        "8\t4\t16\n", "8\t6\t24\n").replace(
+        "4\t5    6    2    1\n",
+        "4\t1    2    3    4\n4\t1    2    6    5\n") + \
+        "\n4\t8    7    6    5"
+
+    def setUp(self):
+        self.polyedr = fake_polyedr(self.CONTENT)
+
+    # Ориентация граней согласуется, внешние нормали направлены наружу
+    def test_orient01(self):
+        self.assertTrue(self.polyedr.orient())
+        for f in self.polyedr.facets:
+            v = f.vertexes
+            n = (v[1] - v[0]).cross(v[2] - v[0]) * f.outward
+            self.assertGreater(n.dot(f.vertexes[0] - R3(0.0, 0.0, 0.0)),
+                               0.0)
+
+    # Незамкнутый полиэдр в этом режиме не обрабатывается
+    def test_orient02(self):
+        self.assertFalse(fake_polyedr().orient())
+
+    # У куба видны ровно три грани, а три ребра скрыты заведомо
+    def test_cull01(self):
+        self.polyedr.orient()
+        self.assertEqual(self.polyedr.cull_back_faces(), 3)
+        self.assertEqual(len(self.polyedr.occluders), 3)
+
+    # Пропущенные проверки нелицевыми гранями не учитываются: у каждой
+    # из трёх лицевых граней четыре ребра
+    def test_skipped01(self):
+        self.assertIn("Проверок    :     12",
+                      self.polyedr.optimize(closed=True))
+
+    # Результат совпадает с обычным удалением невидимых линий
+    def test_shadow01(self):
+        a = fake_polyedr(self.CONTENT)
+        a.optimize()
+        self.polyedr.optimize(closed=True)
+        a, b = visible(a.shadow()), visible(self.polyedr.shadow())
+        for k in a:
+            self.assertAlmostEqual(a[k], b[k])
+
+    def test_king(self):
+        a = visible(shadowed_polyedr("king"))
+        b = visible(shadowed_polyedr("king", optimize={"closed": True}))
+        self.assertLess(sum(abs(a[k] - b[k]) for k in a), 1e-3)
+
+
+class TestFeature(unittest.TestCase):
+
+    # Квадрат, разрезанный диагональю на два треугольника, и треугольник,
+    # примыкающий к нему под прямым углом
+    CONTENT = """100.0	0.0	0.0	0.0
+5	3	9
+0.0	0.0	0.0
+1.0	0.0	0.0
+1.0	1.0	0.0
+0.0	1.0	0.0
+0.5	0.0	1.0
+3	1    2    3
+3	1    3    4
+3	1    2    5"""
+
+    def test_feature01(self):
+        p = fake_polyedr(self.CONTENT)
+        self.assertIn("Рёбер после :      6", p.optimize(feature=1.0))
+        self.assertNotIn(p.topology[(0, 2)], p.edges)
+        self.assertIn(p.topology[(0, 1)], p.edges)
+
+    def test_feature02(self):
+        p = fake_polyedr(self.CONTENT)
+        p.optimize()
+        self.assertEqual(len(p.edges), 7)
+
+    # Рёбра контура не удаляются, даже если грани почти параллельны
+    def test_feature03(self):
+        p = fake_polyedr(self.CONTENT.replace("0.5	0.0	1.0",
+                                              "0.5	0.5	-0.01"))
+        p.optimize(feature=10.0)
+        self.assertIn(p.topology[(0, 1)], p.edges)
+
+
+class TestFromGeom(unittest.TestCase):
+
+    # Рёбра, построенные по массиву пар индексов, совпадают с рёбрами
+    # построчной загрузки (в том числе порядком и направлением)
+    def test_from_geom(self):
+        a = Polyedr('data/king.geom')
+        for np in (common.geom.np, None):
+            with patch('common.geom.np', np), \
+                    patch('common.r3array.np', np):
+                b = Polyedr('data/king.geom', loader=common.geom.load)
+            self.assertEqual(len(a.edges), len(b.edges))
+            for e, g in zip(a.edges, b.edges):
+                for u, v in ((e.beg, g.beg), (e.fin, g.fin)):
+                    self.assertAlmostEqual(u.x, v.x)
+                    self.assertAlmostEqual(u.y, v.y)
+                    self.assertAlmostEqual(u.z, v.z)
+                self.assertEqual([f.indexes for f in e.facets],
+                                 [list(f.indexes) for f in g.facets])
+            self.assertEqual(sorted(a.topology), sorted(b.topology))
+
+
+class TestMergeFacets(unittest.TestCase):
+
+    # Два треугольника, образующих квадрат, невыпуклый четырёхугольник
+    # из двух треугольников и ребро под ними
+    CONTENT = """100.0	0.0	0.0	0.0
+11	4	13
+0.0	0.0	0.0
+1.0	0.0	0.0
+1.0	1.0	0.0
+0.0	1.0	0.0
+2.0	0.0	0.0
+3.0	0.0	0.0
+2.5	0.2	0.0
+2.5	1.0	0.0
+-1.0	0.5	-1.0
+4.0	0.5	-1.0
+4.0	0.6	-1.0
+3	1    2    3
+3	1    3    4
+3	5    6    7
+3	5    7    8
+3	9    10    11"""
+
+    def setUp(self):
+        self.polyedr = fake_polyedr(self.CONTENT)
+
+    def test_merge01(self):
+        result = self.polyedr.optimize(coplanar=0.01)
+        self.assertIn("Граней после:      4", result)
+        square = self.polyedr.facets[0].occluder
+        self.assertIs(self.polyedr.facets[1].occluder, square)
+        self.assertEqual(sorted(square.indexes), [0, 1, 2, 3])
+
+    # Невыпуклые многоугольники не образуются
+    def test_merge02(self):
+        self.polyedr.optimize(coplanar=0.01)
+        self.assertIs(self.polyedr.facets[2].occluder,
+                      self.polyedr.facets[2])
+
+    # Слияние не меняет результат удаления невидимых линий
+    def test_merge03(self):
+        a = fake_polyedr(self.CONTENT)
+        a.optimize()
+        self.polyedr.optimize(coplanar=0.01)
+        a, b = visible(a.shadow()), visible(self.polyedr.shadow())
+        for k in a:
+            self.assertAlmostEqual(a[k], b[k])
+
+    # Сетка 3 x 3 вершины (последняя не используется) из шести
+    # треугольников: после первых слияний у многоугольников появляются
+    # вершины на сторонах, но общие стороны остальных пар граней от
+    # этого не пропадают
+    GRID = """100.0	0.0	0.0	0.0
+9	6	15
+0.0	0.0	0.0
+1.0	0.0	0.0
+2.0	0.0	0.0
+0.0	1.0	0.0
+1.0	1.0	0.0
+2.0	1.0	0.0
+0.0	2.0	0.0
+1.0	2.0	0.0
+2.0	2.0	0.0
+3	1    2    5
+3	2    3    6
+3	2    6    5
+3	1    5    4
+3	4    5    8
+3	4    8    7"""
+
+    def test_merge04(self):
+        p = fake_polyedr(self.GRID)
+        p.optimize(coplanar=1.0)
+        for f in p.occluders:
+            f.precompile()
+            self.assertTrue(f.is_convex())
+            self.assertGreaterEqual(len(f.indexes), 3)
+        covered = {n for f in p.occluders for g in p.facets
+                   if g.occluder is f for n in g.indexes}
+        self.assertEqual(covered, set(range(8)))
+        self.assertLess(len(p.occluders), 6)
+
+    # Полоса из треугольников, изогнутая так, что соседние грани почти
+    # параллельны, а дальние — нет: все грани каждого многоугольника
+    # лежат в его плоскости
+    STRIP = """1.0	0.0	0.0	0.0
+14	12	0
+0	0	0.0
+0	1	0.0
+1	0	0.02
+1	1	0.02
+2	0	0.08
+2	1	0.08
+3	0	0.18
+3	1	0.18
+4	0	0.32
+4	1	0.32
+5	0	0.5
+5	1	0.5
+6	0	0.72
+6	1	0.72
+3	1    3    4
+3	1    4    2
+3	3    5    6
+3	3    6    4
+3	5    7    8
+3	5    8    6
+3	7    9    10
+3	7    10    8
+3	9    11    12
+3	9    12    10
+3	11    13    14
+3	11    14    12"""
+
+    def test_merge05(self):
+        p = fake_polyedr(self.STRIP)
+        p.optimize(coplanar=3.0)
+        eps = sin(3.0 * pi / 180.0)
+        self.assertGreater(len(p.occluders), 1)
+        for f in p.facets:
+            self.assertTrue(Polyedr.coplanar(f.occluder, f, eps))
+
+
+class TestCull(unittest.TestCase):
+
+    # Большой квадрат, маленький треугольник под ним, треугольник,
+    # выступающий из-под квадрата, и ребро под всеми гранями
+    CONTENT = """100.0	0.0	0.0	0.0
+13	4	12
+0.0	0.0	0.0
+1.0	0.0	0.0
+1.0	1.0	0.0
+0.0	1.0	0.0
+0.2	0.2	-0.5
+0.6	0.2	-0.5
+0.4	0.6	-0.5
+0.5	0.5	-0.2
+2.0	0.5	-0.2
+0.5	0.8	-0.2
+-1.0	0.3	-1.0
+4.0	0.4	-1.0
+4.0	0.5	-1.0
+4	1    2    3    4
+3	5    6    7
+3	8    9    10
+3	11    12    13"""
+
+    def setUp(self):
+        self.polyedr = fake_polyedr(self.CONTENT)
+
+    def test_cull01(self):
+        result = self.polyedr.optimize(cull=True)
+        self.assertIn("Граней после:      3", result)
+        self.assertNotIn(self.polyedr.facets[1], self.polyedr.occluders)
+        for facets in self.polyedr.nests.values():
+            self.assertNotIn(self.polyedr.facets[1], facets)
+
+    # Частично заслонённая грань остаётся
+    def test_cull02(self):
+        self.polyedr.optimize(cull=True)
+        self.assertIn(self.polyedr.facets[2], self.polyedr.occluders)
+        self.assertIn(self.polyedr.facets[0], self.polyedr.occluders)
+
+    # Удаление заслонённых граней не меняет результат
+    def test_cull03(self):
+        a = fake_polyedr(self.CONTENT)
+        a.optimize()
+        self.polyedr.optimize(cull=True)
+        a, b = visible(a.shadow()), visible(self.polyedr.shadow())
+        self.assertEqual(a.keys(), b.keys())
+        for k in a:
+            self.assertAlmostEqual(a[k], b[k])
+
+    # Неплоский четырёхугольник, плоскость которого поднимается выше
+    # его zmax, треугольник выше этого zmax, но под плоскостью, и ребро
+    # между ними по высоте: для четырёхугольника ребро «низкое», и
+    # треугольник, который его затеняет, не удаляется
+    NON_PLANAR = """1.0	0.0	0.0	0.0
+10	3	10
+0.0	0.0	1.0
+10.0	0.0	0.0
+10.0	10.0	1.0
+0.0	10.0	0.0
+0.5	8.5	1.5
+1.5	8.5	1.5
+1.0	9.5	1.5
+-10.0	9.0	1.2
+10.0	9.0	1.2
+10.0	9.05	1.2
+4	1    2    3    4
+3	5    6    7
+3	8    9    10"""
+
+    def test_cull04(self):
+        a = fake_polyedr(self.NON_PLANAR)
+        a.optimize()
+        b = fake_polyedr(self.NON_PLANAR)
+        b.optimize(cull=True)
+        self.assertIn(b.facets[1], b.occluders)
+        a, b = visible(a.shadow()), visible(b.shadow())
+        self.assertLess(a[(-10.0, 9.0, 10.0, 9.0)], 1.0)
+        self.assertEqual(a, b)
+
+    def test_cull_king(self):
+        a = visible(shadowed_polyedr("king"))
+        b = visible(shadowed_polyedr("king", optimize={"cull": True}))
+        for k in a:
+            self.assertAlmostEqual(a[k], b[k])
+
+
+class TestDDA(unittest.TestCase):
+
+    def setUp(self):
+        self.polyedr = fake_polyedr()
+        self.polyedr.step = 1.0
+
+    def cells(self, x0, y0, x1, y1):
+        return list(self.polyedr.dda_cells(
+            Edge(R3(x0, y0, 0.0), R3(x1, y1, 0.0))))
+
+    def test_dda01(self):
+        self.assertEqual(self.cells(0.5, 0.5, 0.7, 0.2), [(0, 0)])
+
+    def test_dda02(self):
+        self.assertEqual(self.cells(0.5, 0.5, 3.5, 0.7),
+                         [(0, 0), (1, 0), (2, 0), (3, 0)])
+
+    def test_dda03(self):
+        self.assertEqual(self.cells(-0.5, 2.5, -0.2, -0.5),
+                         [(-1, 2), (-1, 1), (-1, 0), (-1, -1)])
+
+    # Отрезок, проходящий через угол гнезда: посещаются оба соседних
+    def test_dda04(self):
+        self.assertEqual(self.cells(0.5, 0.5, 1.5, 1.5),
+                         [(0, 0), (1, 0), (0, 1), (1, 1)])
+
+    def test_dda05(self):
+        self.assertEqual(self.cells(0.5, 0.2, 2.5, 1.2),
+                         [(0, 0), (1, 0), (2, 0), (2, 1)])
+
+    # Посещаются все гнёзда, содержащие точки ребра, и только
+    # гнёзда из прямоугольника, описанного вокруг него
+    def test_dda_cow(self):
+        with patch('optimize_7.polyedr.randrange',
+                   new=Random(1).randrange):
+            p = Polyedr('data/cow.geom')
+            p.optimize(dda=True)
+        for e in p.edges[::10]:
+            cells = set(p.dda_cells(e))
+            self.assertTrue(cells <= set(p.rect_cells(e)))
+            for k in range(11):
+                x = e.beg.x + (e.fin.x - e.beg.x) * k / 10
+                y = e.beg.y + (e.fin.y - e.beg.y) * k / 10
+                self.assertIn((x // p.step, y // p.step), cells)
+
+    def test_dda_king(self):
+        a = visible(shadowed_polyedr("king"))
+        b = visible(shadowed_polyedr("king", optimize={"dda": True}))
+        for k in a:
+            self.assertAlmostEqual(a[k], b[k])
+
+
+class TestGrid(unittest.TestCase):
+
+    def setUp(self):
+        self.facets = [Facet([R3(0.0, 0.0, 0.0)]) for k in range(3)]
+        a, b, c = self.facets
+        self.nests = {(0, 0): [a, b], (0, 1): [b], (1, 1): [b, c]}
+        self.edge = Edge(R3(0.0, 0.0, 0.0), R3(1.0, 1.0, 0.0))
+
+    def test_dense(self):
+        grid = Grid(self.nests, self.facets)
+        self.assertTrue(grid.dense)
+        self.assertEqual(len(grid), 4)
+        self.assertEqual(list(grid.offsets), [0, 2, 3, 3, 5])
+        self.assertEqual(list(grid.ids), [0, 1, 1, 1, 2])
+
+    def test_sparse(self):
+        self.nests[100, 100] = self.nests.pop((1, 1))
+        grid = Grid(self.nests, self.facets)
+        self.assertFalse(grid.dense)
+        self.assertEqual(len(grid), 3)
+        self.assertEqual(list(grid.offsets), [0, 2, 3, 5])
+
+    # Грани не повторяются, грани самого ребра не выдаются, а гнёзда
+    # вне сетки пропускаются
+    def test_candidates(self):
+        for key in ((1, 1), (100, 100)):
+            nests = dict(self.nests)
+            nests[key] = nests.pop((1, 1))
+            grid = Grid(nests, self.facets)
+            self.edge.facets = [self.facets[0]]
+            cells = [(0, 0), (0, 1), (1, 1), (100, 100), (-5, 7)]
+            self.assertEqual(list(grid.candidates(self.edge, cells)),
+                             self.facets[1:])
+            self.edge.facets = []
+            self.assertEqual(list(grid.candidates(self.edge, cells)),
+                             self.facets)
+
+    def test_csr_king(self):
+        a = visible(shadowed_polyedr("king"))
+        b = visible(shadowed_polyedr("king", optimize={"csr": True}))
+        for k in a:
+            self.assertAlmostEqual(a[k], b[k])
+
+    def test_csr_cow(self):
+        kwargs = {"dda": True, "closed": True}
+        a = visible(shadowed_polyedr("cow", optimize=kwargs))
+        kwargs["csr"] = True
+        b = visible(shadowed_polyedr("cow", optimize=kwargs))
+        for k in a:
+            self.assertAlmostEqual(a[k], b[k])
+
+
+class TestQuadtree(unittest.TestCase):
+
+    # Квадратная грань со стороной size и левым нижним углом (x, y)
+    @staticmethod
+    def square(x, y, size):
+        f = Facet([R3(x, y, 0.0), R3(x + size, y, 0.0),
+                   R3(x + size, y + size, 0.0), R3(x, y + size, 0.0)])
+        f.precompile()
+        return f
+
+    # Одна большая грань и сорок девять мелких в углу
+    def setUp(self):
+        self.big = self.square(0.0, 0.0, 64.0)
+        self.small = [self.square(1.0 + k, 1.0 + n, 0.5)
+                      for k in range(7) for n in range(7)]
+        self.tree = Quadtree([self.big] + self.small, capacity=4)
+
+    def test_big(self):
+        self.assertEqual(self.tree.root.facets, [self.big])
+
+    def test_capacity(self):
+        for node, depth in self.tree.nodes():
+            if node.children is None and depth < self.tree.depth:
+                self.assertLessEqual(len(node.facets), 4)
+
+    # Каждая грань хранится ровно один раз и в узле, в который помещается
+    def test_once(self):
+        stored = [f for node, depth in self.tree.nodes()
+                  for f in node.facets]
+        self.assertEqual(len(stored), 50)
+        self.assertEqual(set(stored), set([self.big] + self.small))
+        for node, depth in self.tree.nodes():
+            for f in node.facets:
+                self.assertTrue(node.fits(f))
+
+    def test_candidates(self):
+        e = Edge(R3(1.2, 1.2, -1.0), R3(3.2, 1.4, -1.0))
+        e.facets = [self.small[0]]
+        self.assertEqual(
+            set(self.tree.candidates(e)),
+            set([self.big, self.small[7], self.small[14]]))
+
+    def test_quadtree_king(self):
+        kwargs = {"index": "quadtree"}
+        a = visible(shadowed_polyedr("king"))
+        b = visible(shadowed_polyedr("king", optimize=kwargs))
+        for k in a:
+            self.assertAlmostEqual(a[k], b[k])
+
+    def test_quadtree_stats(self):
+        result = fake_polyedr().optimize(index="quadtree")
+        self.assertIn("Гнездование граней", result)
+        self.assertIn("Квадродерево", result)
+
+
+class TestBVH(unittest.TestCase):
+
+    # Квадратная грань со стороной 1 на высоте z с левым нижним углом (x, y)
+    @staticmethod
+    def square(x, y, z):
+        f = Facet([R3(x, y, z), R3(x + 1.0, y, z),
+                   R3(x + 1.0, y + 1.0, z), R3(x, y + 1.0, z)])
+        f.precompile()
+        return f
+
+    # Ряд граней, высота которых растёт слева направо
+    def setUp(self):
+        self.facets = [self.square(2.0 * k, 0.0, float(k))
+                       for k in range(10)]
+        self.bvh = BVH(list(self.facets), leaf=2)
+
+    # Объём узла содержит объёмы потомков; листья не переполнены
+    def test_build(self):
+        leaves = []
+        for node, depth in self.bvh.nodes():
+            if node.children is None:
+                self.assertLessEqual(len(node.facets), 2)
+                leaves.extend(node.facets)
+                continue
+            for c in node.children:
+                self.assertLessEqual(node.xmin, c.xmin)
+                self.assertGreaterEqual(node.xmax, c.xmax)
+                self.assertGreaterEqual(node.zmax, c.zmax)
+        self.assertEqual(set(leaves), set(self.facets))
+
+    # Грани ниже ребра не выдаются
+    def test_candidates(self):
+        e = Edge(R3(-1.0, 0.5, 4.5), R3(30.0, 0.5, 6.0))
+        self.assertEqual(set(self.bvh.candidates(e)), set(self.facets[5:]))
+        e.facets = [self.facets[7]]
+        self.assertEqual(set(self.bvh.candidates(e)),
+                         set(self.facets[5:7] + self.facets[8:]))
+
+    def test_vertical(self):
+        f = Facet([R3(0.0, 0.0, 0.0), R3(1.0, 0.0, 0.0), R3(1.0, 0.0, 1.0)])
+        f.precompile()
+        self.assertIsNone(BVH([f]).root)
+
+    def test_bvh_king(self):
+        a = visible(shadowed_polyedr("king", optimize={"index": "quadtree"}))
+        b = visible(shadowed_polyedr("king", optimize={"index": "bvh"}))
+        for k in a:
+            self.assertAlmostEqual(a[k], b[k])
+
+    def test_bvh_stats(self):
+        result = fake_polyedr().optimize(index="bvh")
+        self.assertIn("Иерархия ограничивающих объёмов", result)
+
+
+class TestZSort(unittest.TestCase):
+
+    def setUp(self):
+        with patch('optimize_7.polyedr.randrange', new=Random(1).randrange):
+            self.polyedr = Polyedr('data/king.geom')
+            self.polyedr.optimize(zsort=True)
+
+    def test_sorted(self):
+        p = self.polyedr
+        for key, facets in p.nests.items():
+            self.assertEqual(list(p.heights[key]),
+                             [-f.zmax for f in facets])
+            self.assertEqual(list(p.heights[key]),
+                             sorted(p.heights[key]))
+
+    # Отбрасываются только «низкие» для ребра грани
+    def test_candidates(self):
+        p, heights = self.polyedr, self.polyedr.heights
+        grids = (None, None), (Grid(p.nests, p.occluders),
+                               Grid(p.nests, p.occluders, True))
+        for plain, zsorted in grids:
+            for e in p.edges:
+                z = min(e.beg.z, e.fin.z)
+                p.heights, p.grid = None, plain
+                a = set(f for f in p.candidates(e) if f.zmax > z)
+                p.heights, p.grid = heights, zsorted
+                self.assertEqual(set(p.candidates(e)), a)
+
+    def test_zsort_king(self):
+        a = visible(shadowed_polyedr("king"))
+        b = visible(shadowed_polyedr("king", optimize={"zsort": True}))
+        c = visible(shadowed_polyedr("king", optimize={"zsort": True,
+                                                       "csr": True}))
+        for k in a:
+            self.assertAlmostEqual(a[k], b[k])
+            self.assertAlmostEqual(a[k], c[k])
+
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        with patch('optimize_7.polyedr.randrange', new=Random(1).randrange):
+            self.polyedr = Polyedr('data/king.geom')
+            self.polyedr.optimize(index="sweep")
+
+    # Пары совпадают с найденными перебором всех рёбер и граней
+    def test_pairs(self):
+        p = self.polyedr
+        count = 0
+        for e in p.edges:
+            x0, x1 = sorted((e.beg.x, e.fin.x))
+            y0, y1 = sorted((e.beg.y, e.fin.y))
+            z = min(e.beg.z, e.fin.z)
+            own = [f.occluder for f in e.facets]
+            a = [f for f in p.occluders
+                 if f.xmin <= x1 and f.xmax >= x0 and f.ymin <= y1 and
+                 f.ymax >= y0 and f.zmax > z and f not in own and
+                 not f.is_vertical()]
+            self.assertEqual(p.candidates(e), a)
+            count += len(a)
+        self.assertEqual(len(p.pairs), count)
+
+    def test_empty(self):
+        sweep = Sweep([], [])
+        self.assertEqual(len(sweep), 0)
+        self.assertEqual(list(sweep.offsets), [0])
+
+    def test_sweep_king(self):
+        a = visible(shadowed_polyedr("king"))
+        b = visible(shadowed_polyedr("king", optimize={"index": "sweep"}))
+        for k in a:
+            self.assertAlmostEqual(a[k], b[k])
+
+
+class TestBatch(unittest.TestCase):
+
+    # Тени, вычисленные для пакета рёбер, совпадают с Edge.clip
+    @unittest.skipIf(optimize_7.polyedr.np is None, "нет NumPy")
+    def test_clip_many(self):
+        f = Facet([R3(0.0, 0.0, 0.0), R3(2.0, 0.0, 0.5),
+                   R3(2.0, 2.0, 1.0), R3(0.0, 2.0, 0.5)])
+        f.precompile()
+        rnd = Random(1)
+        edges = [Edge(R3(rnd.uniform(-1, 3), rnd.uniform(-1, 3),
+                         rnd.uniform(-1, 2)),
+                      R3(rnd.uniform(-1, 3), rnd.uniform(-1, 3),
+                         rnd.uniform(-1, 2))) for k in range(200)]
+        coords = optimize_7.polyedr.np.array(
+            [(e.beg.x, e.beg.y, e.beg.z, e.fin.x, e.fin.y, e.fin.z)
+             for e in edges]).T
+        t0, t1, mask = f.clip_many(*coords)
+        for k, e in enumerate(edges):
+            clipped = e.clip(f)
+            if clipped is None:
+                self.assertFalse(mask[k])
+            else:
+                self.assertTrue(mask[k])
+                self.assertEqual((t0[k], t1[k]), clipped)
+
+    # Обход по граням даёт в точности те же «просветы», что и по рёбрам
+    def test_batch_king(self):
+        def gaps(batch):
+            p = shadowed_polyedr("king", optimize={"index": "sweep"},
+                                 shadow={"batch": batch})
+            return [[(s.beg, s.fin) for s in e.gaps] for e in p.edges]
+        a = gaps(False)
+        self.assertEqual(gaps(True), a)
+        with patch('optimize_7.polyedr.np', None):
+            self.assertEqual(gaps(True), a)
+
+    # Тени всех кандидатов, вычисленные сразу, совпадают с вычисленными
+    # по одной, как из гнёзд, так и из массива пар; без NumPy порог
+    # ни на что не влияет
+    def test_vector_king(self):
+        def gaps(index, vector):
+            p = shadowed_polyedr("king", optimize={"index": index},
+                                 shadow={"vector": vector})
+            return [[(s.beg, s.fin) for s in e.gaps] for e in p.edges]
+        for index in ("grid", "sweep"):
+            a = gaps(index, None)
+            self.assertEqual(gaps(index, 0), a)
+            self.assertEqual(gaps(index, 20), a)
+            with patch('optimize_7.polyedr.np', None):
+                self.assertEqual(gaps(index, 0), a)
+
+    # vector=True означает измеренный порог Polyedr.VECTOR
+    @unittest.skipIf(optimize_7.polyedr.np is None, "нет NumPy")
+    def test_vector_default(self):
+        vector_shadow, sizes = Polyedr.vector_shadow, []
+
+        def spy(poly, e, idx):
+            sizes.append(len(idx))
+            return vector_shadow(poly, e, idx)
+        with patch.object(Polyedr, "vector_shadow", new=spy), \
+                patch.object(Polyedr, "VECTOR", 20):
+            p = shadowed_polyedr("king", shadow={"vector": True})
+        self.assertGreater(len(sizes), 0)
+        self.assertGreaterEqual(min(sizes), 20)
+        self.assertEqual(visible(p), visible(shadowed_polyedr("king")))
+
+    def test_vector_merge(self):
+        a = visible(shadowed_polyedr("king"))
+        b = visible(shadowed_polyedr("king", shadow={"vector": 0,
+                                                     "merge": True}))
+        self.assertEqual(a, b)
+
+    # Без заранее построенных пар они находятся заметанием
+    def test_batch_grid(self):
+        a = visible(shadowed_polyedr("king", optimize={"index": "sweep"}))
+        b = visible(shadowed_polyedr("king", shadow={"batch": True}))
+        self.assertEqual(a, b)
+
+    # Рёбра, затенённые целиком ещё до обхода (нелицевые в режиме
+    # замкнутого полиэдра), в пакеты не попадают
+    @unittest.skipIf(optimize_7.polyedr.np is None, "нет NumPy")
+    def test_batch_closed(self):
+        with patch('optimize_7.polyedr.randrange', new=Random(1).randrange):
+            p = Polyedr('data/king.geom')
+            p.optimize(closed=True, index="sweep")
+        hidden = {e.beg.x + 2.0 * e.fin.x for e in p.edges if not e.gaps}
+        self.assertGreater(len(hidden), 0)
+        clip_many, clipped = Facet.clip_many, set()
+
+        def spy(f, x0, y0, z0, x1, y1, z1):
+            clipped.update((x0 + 2.0 * x1).tolist())
+            return clip_many(f, x0, y0, z0, x1, y1, z1)
+        with patch.object(Facet, "clip_many", new=spy):
+            p.shadow(batch=True)
+        self.assertFalse(hidden & clipped)
+        self.assertTrue(all(not e.gaps for e in p.edges
+                            if e.beg.x + 2.0 * e.fin.x in hidden))
+        self.assertEqual(visible(p), visible(shadowed_polyedr(
+            "king", optimize={"closed": True, "index": "sweep"})))
+
+
+class TestOrder(unittest.TestCase):
+
+    # Площадь проекции грани
+    def test_area(self):
+        f = Facet([R3(0.0, 0.0, 0.0), R3(2.0, 0.0, 1.0),
+                   R3(2.0, 3.0, 1.0), R3(0.0, 3.0, 0.0)])
+        f.precompile()
+        self.assertAlmostEqual(f.area, 6.0)
+
+    # Доля ребра, попадающая в прямоугольник грани
+    def test_overlap(self):
+        f = Facet([R3(0.0, 0.0, 0.0), R3(2.0, 0.0, 0.0),
+                   R3(2.0, 2.0, 0.0), R3(0.0, 2.0, 0.0)])
+        f.precompile()
+        e = Edge(R3(1.0, 1.0, 0.0), R3(5.0, 1.0, 0.0))
+        self.assertAlmostEqual(Polyedr.overlap(e, f), 0.25)
+        e = Edge(R3(3.0, 1.0, 0.0), R3(5.0, 1.0, 0.0))
+        self.assertEqual(Polyedr.overlap(e, f), 0.0)
+
+    # Порядок перебора кандидатов не меняет результата, а число
+    # проверок вместе со сэкономленными равно числу кандидатов
+    def test_orders(self):
+        base = shadowed_polyedr("king")
+        for order in Polyedr.ORDERS:
+            p = shadowed_polyedr("king", shadow={"order": order})
+            self.assertEqual(visible(p), visible(base))
+            self.assertEqual(p.tests + p.saved, sum(
+                len(list(p.candidates(e))) for e in p.edges))
+        cell = shadowed_polyedr("king", shadow={"order": "cell"})
+        self.assertEqual(cell.tests, base.tests)
+        self.assertEqual(base.saved, 0)
+
+    # smart_shadow можно вызывать и без shadow
+    def test_smart_shadow(self):
+        with patch('optimize_7.polyedr.randrange', new=Random(1).randrange):
+            p = Polyedr('data/king.geom')
+            p.optimize()
+        for e in p.edges:
+            p.smart_shadow(e)
+        self.assertGreater(p.tests, 0)
+        self.assertEqual(visible(p), visible(shadowed_polyedr("king")))
+
+    # В режиме замкнутого полиэдра нелицевые рёбра затенены ещё до
+    # перебора кандидатов: ни проверок, ни сэкономленных проверок на
+    # них не приходится
+    def test_orders_closed(self):
+        base = shadowed_polyedr("king", optimize={"closed": True})
+        for order in ("zmax", "overlap"):
+            with patch('optimize_7.polyedr.randrange',
+                       new=Random(1).randrange):
+                p = Polyedr('data/king.geom')
+                p.optimize(closed=True)
+            front = [e for e in p.edges if e.gaps]
+            self.assertLess(len(front), len(p.edges))
+            p.shadow(order=order)
+            self.assertEqual(visible(p), visible(base))
+            self.assertEqual(p.tests + p.saved, sum(
+                len(list(p.candidates(e))) for e in front))
+
+
+class TestCoherence(unittest.TestCase):
+
+    # Обход в ширину содержит каждое ребро ровно один раз, и каждое
+    # ребро, кроме первого в своей компоненте, имеет общую вершину с
+    # одним из предыдущих
+    def test_bfs_edges(self):
+        p = shadowed_polyedr("king", shadow={"coherence": True})
+        edges = p.bfs_edges()
+        self.assertEqual(sorted(map(id, edges)), sorted(map(id, p.edges)))
+        seen = {edges[0].beg, edges[0].fin}
+        for e in edges[1:]:
+            self.assertTrue(e.beg in seen or e.fin in seen)
+            seen.update((e.beg, e.fin))
+
+    # Кэш в вершинах не меняет результата; счётчики попаданий и
+    # промахов учитывают каждое ребро
+    def test_coherence(self):
+        for index in ("grid", "sweep"):
+            base = shadowed_polyedr("king", optimize={"index": index})
+            p = shadowed_polyedr("king", optimize={"index": index},
+                                 shadow={"coherence": True})
+            self.assertEqual(visible(p), visible(base))
+            self.assertGreater(p.hits, 0)
+            self.assertEqual(p.hits + p.misses, len(p.edges))
+        self.assertEqual(base.hits, 0)
+
+    # Рёбра, затенённые ещё до перебора (нелицевые в режиме замкнутого
+    # полиэдра), не считаются попаданиями и не попадают в кэш
+    def test_coherence_closed(self):
+        base = shadowed_polyedr("king", optimize={"closed": True})
+        with patch('optimize_7.polyedr.randrange', new=Random(1).randrange):
+            p = Polyedr('data/king.geom')
+            p.optimize(closed=True)
+        front = [e for e in p.edges if e.gaps]
+        self.assertLess(len(front), len(p.edges))
+        p.shadow(coherence=True)
+        self.assertEqual(visible(p), visible(base))
+        self.assertEqual(p.hits + p.misses, len(front))
+
+
+class TestWeld(unittest.TestCase):
+
+    # Девятая вершина почти совпадает с первой, поэтому грань,
+    # в которой она используется, не имеет общих рёбер с соседними
+    CONTENT = FAKE_FILE_CONTENT.replace(
+        "8\t4\t16\n", "9\t4\t16\n").replace(
+        "4\t5    6    2    1",
+        "-0.5\t-0.5\t0.5000001\n4\t5    6    2    9")
+
+    def setUp(self):
+        self.polyedr = fake_polyedr(self.CONTENT)
+
+    def test_before(self):
+        self.assertEqual(len(self.polyedr.vertexes), 9)
+        self.assertEqual(len(self.polyedr.edges), 13)
+
+    def test_weld(self):
+        p = self.polyedr
+        p.weld(1e-3)
+        self.assertEqual(len(p.vertexes), 8)
+        self.assertEqual(len(p.edges), 12)
+        self.assertEqual(len(p.facets), 4)
+
+    # Далёкие вершины не свариваются
+    def test_weld_small_eps(self):
+        p = self.polyedr
+        p.weld(1e-9)
+        self.assertEqual(len(p.vertexes), 9)
+        self.assertEqual(len(p.edges), 13)
+
+    # Статистика сварки выводится в результатах оптимизации
+    def test_optimize(self):
+        p = self.polyedr
+        result = p.optimize(weld=1e-3)
+        self.assertIn("Сварка вершин", result)
+        self.assertIn("Рёбер после :     12", result)
+
+
+class TestMerge(unittest.TestCase):
+
+    # Объединение упорядочивает и сливает перекрывающиеся отрезки
+    def test_union01(self):
+        union = Edge.union([Segment(0.5, 0.7), Segment(0.1, 0.2),
+                            Segment(0.6, 0.9), Segment(0.2, 0.3)])
+        self.assertEqual([(s.beg, s.fin) for s in union],
+                         [(0.1, 0.3), (0.5, 0.9)])
+
+    # Накопленные тени дают те же «просветы», что и их вычитание
+    def test_merge01(self):
+        rnd = Random(2)
+        for k in range(100):
+            a, b = Edge(R3(0.0, 0.0, 0.0), R3(1.0, 0.0, 0.0)), \
+                Edge(R3(0.0, 0.0, 0.0), R3(1.0, 0.0, 0.0))
+            b.collect()
+            for n in range(rnd.randrange(1, 12)):
+                t0, t1 = sorted((rnd.random(), rnd.random()))
+                gaps = [s.subtraction(Segment(t0, t1)) for s in a.gaps]
+                a.gaps = [s for g in gaps for s in g
+                          if not s.is_degenerate()]
+                b.add_shade(Segment(t0, t1))
+            b.merge()
+            self.assertEqual([(s.beg, s.fin) for s in a.gaps],
+                             [(s.beg, s.fin) for s in b.gaps])
+
+    # Ребро, полностью закрытое несколькими тенями, сразу помечается
+    # как невидимое
+    def test_hidden01(self):
+        e = Edge(R3(0.0, 0.0, 0.0), R3(1.0, 0.0, 0.0))
+        e.collect()
+        e.add_shade(Segment(0.0, 0.6))
+        e.add_shade(Segment(0.4, 1.0))
+        self.assertEqual(len(e.gaps), 0)
+        e.merge()
+        self.assertEqual(len(e.gaps), 0)
+
+    # Для модели в целом результат совпадает с вычитанием теней
+    def test_king(self):
+        a = visible(shadowed_polyedr("king"))
+        b = visible(shadowed_polyedr("king", shadow={"merge": True}))
+        for k in a:
+            self.assertAlmostEqual(a[k], b[k])
+
+
+class TestClip(unittest.TestCase):
+
+    def setUp(self):
+        self.f = Facet([R3(0.0, 0.0, 0.0), R3(2.0, 0.0, 0.0),
+                        R3(2.0, 2.0, 0.0), R3(0.0, 2.0, 0.0)])
+        self.f.precompile()
+
+    # Центр грани лежит внутри всех её «вертикальных» полупространств
+    def test_lines01(self):
+        self.assertEqual(len(self.f.lines), 4)
+        for a, b, u, v in self.f.lines:
+            self.assertLess(a * (1.0 - u) + b * (1.0 - v), 0.0)
+
+    # Точки над гранью лежат вне «горизонтального» полупространства
+    def test_plane01(self):
+        a, b, c, u, v, w = self.f.plane
+        self.assertGreater(a * (1.0 - u) + b * (1.0 - v) + c * (1.0 - w),
+                           0.0)
+
+    # Ребро под гранью затеняется целиком
+    def test_clip01(self):
+        e = Edge(R3(0.5, 0.5, -1.0), R3(1.5, 1.5, -1.0))
+        self.assertEqual(e.clip(self.f), (0.0, 1.0))
+
+    # Ребро над гранью не затеняется
+    def test_clip02(self):
+        e = Edge(R3(0.5, 0.5, 1.0), R3(1.5, 1.5, 1.0))
+        self.assertIsNone(e.clip(self.f))
+
+    # Ребро, выходящее за пределы грани, затеняется частично
+    def test_clip03(self):
+        e = Edge(R3(-1.0, 1.0, -1.0), R3(3.0, 1.0, -1.0))
+        t0, t1 = e.clip(self.f)
+        self.assertAlmostEqual(t0, 0.25)
+        self.assertAlmostEqual(t1, 0.75)
+
+    # Ребро, пересекающее плоскость грани, затеняется до точки пересечения
+    def test_clip04(self):
+        e = Edge(R3(1.0, 1.0, -1.0), R3(1.0, 1.5, 1.0))
+        t0, t1 = e.clip(self.f)
+        self.assertAlmostEqual(t0, 0.0)
+        self.assertAlmostEqual(t1, 0.5)
+
+    # Ребро вне проекции грани не затеняется
+    def test_clip05(self):
+        e = Edge(R3(3.0, 0.0, -1.0), R3(3.0, 2.0, -1.0))
+        self.assertIsNone(e.clip(self.f))
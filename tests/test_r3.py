@@ -1,7 +1,7 @@
 import unittest
 
 from math import pi
-from common.r3 import R3
+from common.r3 import R3, Transform
 from tests.matchers import R3ApproxMatcher
 
 
@@ -108,3 +108,83 @@ class TestR3(unittest.TestCase):
     def test_cross04(self):
         self.assertEqual(R3ApproxMatcher(self.a.cross(R3(3.0, -2.0, 1.0))),
                          R3(8.0, 8.0, -8.0))
+
+    def test_slots01(self):
+        self.assertFalse(hasattr(self.a, "__dict__"))
+
+    def test_add_to01(self):
+        b = self.a.add_to(R3(1.0, 1.0, 1.0))
+        self.assertIs(b, self.a)
+        self.assertEqual(R3ApproxMatcher(self.a), R3(2.0, 3.0, 4.0))
+
+    def test_sub_from01(self):
+        b = self.a.sub_from(R3(1.0, 1.0, 1.0))
+        self.assertIs(b, self.a)
+        self.assertEqual(R3ApproxMatcher(self.a), R3(0.0, 1.0, 2.0))
+
+    def test_mul_by01(self):
+        b = self.a.mul_by(2.0)
+        self.assertIs(b, self.a)
+        self.assertEqual(R3ApproxMatcher(self.a), R3(2.0, 4.0, 6.0))
+
+    # Операторы +=, -= и *= создают новый вектор, не меняя исходный
+    def test_iadd01(self):
+        b = self.a
+        b += R3(1.0, 1.0, 1.0)
+        b -= R3(0.5, 0.5, 0.5)
+        b *= 2.0
+        self.assertIsNot(b, self.a)
+        self.assertEqual(R3ApproxMatcher(self.a), R3(1.0, 2.0, 3.0))
+        self.assertEqual(R3ApproxMatcher(b), R3(3.0, 5.0, 7.0))
+
+    def test_dot_sub01(self):
+        p, q = R3(3.0, -1.0, 2.0), R3(1.0, 1.0, 1.0)
+        self.assertAlmostEqual(self.a.dot_sub(p, q), self.a.dot(p - q))
+
+    def test_dot_sub02(self):
+        self.assertEqual(self.a.dot_sub(self.a, self.a), 0.0)
+
+    def test_lerp01(self):
+        b = R3(3.0, 2.0, 1.0)
+        self.assertEqual(R3ApproxMatcher(self.a.lerp(b, 0.0)), self.a)
+        self.assertEqual(R3ApproxMatcher(self.a.lerp(b, 1.0)), b)
+
+    def test_lerp02(self):
+        b = R3(3.0, 2.0, 1.0)
+        self.assertEqual(R3ApproxMatcher(self.a.lerp(b, 0.25)),
+                         self.a * 0.75 + b * 0.25)
+
+
+class TestTransform(unittest.TestCase):
+
+    def setUp(self):
+        self.a = R3(1.0, 2.0, 3.0)
+
+    def test_identity01(self):
+        self.assertEqual(R3ApproxMatcher(Transform().apply(self.a)), self.a)
+
+    def test_rz01(self):
+        self.assertEqual(R3ApproxMatcher(Transform.rz(1.0).apply(self.a)),
+                         self.a.rz(1.0))
+
+    def test_ry01(self):
+        self.assertEqual(R3ApproxMatcher(Transform.ry(1.0).apply(self.a)),
+                         self.a.ry(1.0))
+
+    def test_scale01(self):
+        self.assertEqual(R3ApproxMatcher(Transform(c=2.0).apply(self.a)),
+                         self.a * 2.0)
+
+    def test_euler01(self):
+        t = Transform.euler(0.3, -1.2, 2.5, 40.0)
+        self.assertEqual(R3ApproxMatcher(t.apply(self.a)),
+                         self.a.rz(0.3).ry(-1.2).rz(2.5) * 40.0)
+
+    def test_compose01(self):
+        t = Transform.ry(0.7) @ Transform(c=3.0) @ Transform.rz(0.4)
+        self.assertEqual(R3ApproxMatcher(t.apply(self.a)),
+                         self.a.rz(0.4).ry(0.7) * 3.0)
+
+    def test_transform01(self):
+        t = Transform.euler(0.3, -1.2, 2.5)
+        self.assertEqual(R3ApproxMatcher(self.a.transform(t)), t.apply(self.a))
@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import patch
+
+from math import pi
+from common.r3 import R3, Transform
+from common.r3array import R3Array
+from tests.matchers import R3ApproxMatcher
+
+
+class TestR3Array(unittest.TestCase):
+
+    def setUp(self):
+        self.vectors = [R3(1.0, 2.0, 3.0), R3(-1.0, 0.5, 2.0),
+                        R3(0.0, 0.0, 0.0)]
+        self.a = R3Array.from_r3(self.vectors)
+        self.b = R3Array.from_rows([(3.0, 2.0, 1.0), (1.0, 1.0, 1.0),
+                                    (0.0, 1.0, 0.0)])
+
+    def assertVectors(self, array, expected):
+        self.assertIsInstance(array, R3Array)
+        self.assertEqual(len(array), len(expected))
+        for u, v in zip(array.to_r3(), expected):
+            self.assertEqual(R3ApproxMatcher(v), u)
+
+    def test_len01(self):
+        self.assertEqual(len(self.a), 3)
+
+    def test_getitem01(self):
+        self.assertIsInstance(self.a[1], R3)
+        self.assertEqual(R3ApproxMatcher(self.vectors[1]), self.a[1])
+
+    def test_getitem02(self):
+        self.assertVectors(self.a[1:], self.vectors[1:])
+
+    def test_getitem03(self):
+        self.assertVectors(self.a[[2, 0]], [self.vectors[2],
+                                            self.vectors[0]])
+
+    def test_add01(self):
+        self.assertVectors(self.a + self.b, [
+            u + v for u, v in zip(self.vectors, self.b.to_r3())])
+
+    def test_add02(self):
+        self.assertVectors(self.a + R3(1.0, 0.0, -1.0), [
+            u + R3(1.0, 0.0, -1.0) for u in self.vectors])
+
+    def test_sub01(self):
+        self.assertVectors(self.a - self.b, [
+            u - v for u, v in zip(self.vectors, self.b.to_r3())])
+
+    def test_sub02(self):
+        self.assertVectors(self.a - self.a, [R3(0.0, 0.0, 0.0)] * 3)
+
+    def test_mul01(self):
+        self.assertVectors(self.a * 2.0, [u * 2.0 for u in self.vectors])
+
+    def test_rz01(self):
+        self.assertVectors(self.a.rz(pi / 3), [
+            u.rz(pi / 3) for u in self.vectors])
+
+    def test_ry01(self):
+        self.assertVectors(self.a.ry(pi / 3), [
+            u.ry(pi / 3) for u in self.vectors])
+
+    def test_transform01(self):
+        t = Transform.euler(0.3, -1.2, 2.5, 40.0)
+        self.assertVectors(t.apply(self.a), [
+            t.apply(u) for u in self.vectors])
+
+    def test_rows01(self):
+        self.assertVectors(R3Array.from_rows(self.a.rows()), self.vectors)
+
+    def test_dot01(self):
+        for d, u, v in zip(self.a.dot(self.b), self.vectors, self.b.to_r3()):
+            self.assertAlmostEqual(float(d), u.dot(v))
+
+    def test_cross01(self):
+        self.assertVectors(self.a.cross(self.b), [
+            u.cross(v) for u, v in zip(self.vectors, self.b.to_r3())])
+
+
+# Те же проверки для реализации без NumPy
+class TestR3ArrayWithoutNumpy(TestR3Array):
+
+    def setUp(self):
+        patcher = patch('common.r3array.np', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp()
+
+    def test_lists01(self):
+        self.assertIsInstance(self.a.x, list)